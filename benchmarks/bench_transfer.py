@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Offline transfer benchmark: SafeBufferedStream and transfer_process against
+a simulated Telegram client (no account, no network)
+
+Usage:
+    python benchmarks/bench_transfer.py [--mode stream|transfer|both]
+        [--configs 512K:2,2M:3,4M:4] [--files 4] [--size-mb 32]
+        [--down-mbps 40] [--up-mbps 20] [--latency-ms 40]
+        [--floodwait-rate 0.0] [--floodwait-seconds 2] [--keep-delays]
+
+Each configuration (CHUNK_SIZE:QUEUE_SIZE) runs in its own process, so CPU
+time and peak RSS are per configuration. The fake client covers the surface
+used by the bot: iter_messages, get_messages, iter_download, download_media,
+send_file, send_message and message.edit. Downloads/uploads are paced by a
+per-direction bandwidth cap plus a fixed latency per request. FloodWait hits
+requests at random with the given rate; like Telethon, waits up to
+FLOOD_SLEEP_THRESHOLD are slept inside the client, longer ones are raised.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import inspect
+import argparse
+import resource
+import traceback
+import multiprocessing
+from queue import Empty
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MB = 1024 * 1024
+
+# --- SIMULATED TELEGRAM ---
+class Link:
+    """One direction of the connection: bandwidth cap + per-request latency"""
+    def __init__(self, mbps, latency_ms, floodwait_rate, floodwait_seconds, flood_sleep_threshold):
+        self.bytes_per_second = mbps * MB / 8
+        self.latency = latency_ms / 1000.0
+        self.floodwait_rate = floodwait_rate
+        self.floodwait_seconds = floodwait_seconds
+        self.flood_sleep_threshold = flood_sleep_threshold
+        self.available_at = 0.0  # Requests share the link one after another
+        self.floodwaits = 0
+
+    async def transfer(self, size):
+        from telethon import errors
+        if self.floodwait_rate and random.random() < self.floodwait_rate:
+            self.floodwaits += 1
+            if self.floodwait_seconds > self.flood_sleep_threshold:
+                raise errors.FloodWaitError(request=None, capture=self.floodwait_seconds)
+            await asyncio.sleep(self.floodwait_seconds)
+
+        loop = asyncio.get_running_loop()
+        start = max(loop.time(), self.available_at)
+        self.available_at = start + self.latency + size / self.bytes_per_second
+        await asyncio.sleep(self.available_at - loop.time())
+
+class FakeStatusMessage:
+    def __init__(self, latency):
+        self.latency = latency
+        self.edits = 0
+
+    async def edit(self, text, buttons=None):
+        self.edits += 1
+        await asyncio.sleep(self.latency)
+
+class FakeEvent:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def respond(self, text, buttons=None):
+        await asyncio.sleep(self.latency)
+        return FakeStatusMessage(self.latency)
+
+def make_message(message_id, size, kind):
+    """Telethon-shaped message with a document of the given size"""
+    from types import SimpleNamespace
+    from telethon.tl.types import (
+        MessageMediaDocument, Document, DocumentAttributeFilename, DocumentAttributeVideo
+    )
+    if kind == 'video':
+        name, mime = f"clip_{message_id}.mp4", "video/mp4"
+        attributes = [DocumentAttributeFilename(name), DocumentAttributeVideo(duration=60, w=1280, h=720)]
+    else:
+        name, mime = f"archive_{message_id}.zip", "application/zip"
+        attributes = [DocumentAttributeFilename(name)]
+
+    document = Document(
+        id=message_id, access_hash=0, file_reference=b"", date=None, mime_type=mime,
+        size=size, dc_id=1, attributes=attributes
+    )
+    return SimpleNamespace(
+        id=message_id, action=None, text=f"caption {message_id}", photo=None,
+        media=MessageMediaDocument(document=document), document=document,
+        file=SimpleNamespace(size=size, name=name, mime_type=mime, duration=60 if kind == 'video' else None),
+    )
+
+class FakeUserClient:
+    """Download side: messages and file bytes"""
+    def __init__(self, messages, link):
+        self.messages = {m.id: m for m in messages}
+        self.link = link
+        self.bytes_downloaded = 0
+
+    async def iter_messages(self, chat, min_id=0, max_id=0, reverse=False):
+        for message_id in sorted(self.messages, reverse=not reverse):
+            if min_id < message_id < max_id:
+                yield self.messages[message_id]
+
+    async def get_messages(self, chat, ids=None):
+        await self.link.transfer(256)
+        return self.messages.get(ids)
+
+    async def iter_download(self, location, offset=0, limit=None, chunk_size=MB,
+                            request_size=MB, file_size=None, **kwargs):
+        size = location.size if file_size is None else file_size
+        position, sent = offset, 0
+        payload = bytes(range(256)) * (chunk_size // 256 + 1)
+        while position < size and (limit is None or sent < limit):
+            length = min(chunk_size, size - position)
+            await self.link.transfer(length)
+            self.bytes_downloaded += length
+            position += length
+            sent += 1
+            yield payload[:length]
+
+    async def download_media(self, message, file=None, thumb=None, progress_callback=None):
+        if thumb is not None:
+            await self.link.transfer(20 * 1024)
+            return None  # No preview: exercises the "no thumbnail" path
+        data = bytearray()
+        async for chunk in self.iter_download(message.document):
+            data += chunk
+        return bytes(data)
+
+class FakeBotClient:
+    """Upload side: consumes the file like Telethon, part by part"""
+    def __init__(self, link):
+        self.link = link
+        self.bytes_uploaded = 0
+        self.files = 0
+
+    async def send_message(self, chat, text, **kwargs):
+        await self.link.transfer(len(text))
+
+    async def send_file(self, chat, file, file_size=None, part_size_kb=512, **kwargs):
+        part_size = int(part_size_kb * 1024)
+        uploaded = 0
+        while True:
+            data = file.read(part_size)
+            if inspect.isawaitable(data):
+                data = await data
+            if not data:
+                break
+            await self.link.transfer(len(data))
+            uploaded += len(data)
+        self.bytes_uploaded += uploaded
+        self.files += 1
+
+# --- SCENARIOS ---
+async def bench_stream(args, down, up):
+    """SafeBufferedStream alone: downloader task vs an uploader reading parts"""
+    import config
+    from telethon import errors
+    from stream import SafeBufferedStream
+
+    user = FakeUserClient([], down)
+    bot = FakeBotClient(up)
+    status = FakeStatusMessage(0.0)
+    total_bytes = 0
+    for index in range(args.files):
+        message = make_message(index + 1, args.size_mb * MB, 'file')
+        while True:
+            stream = SafeBufferedStream(user, message.document, message.file.size,
+                                        message.file.name, time.time(), status)
+            try:
+                await bot.send_file(None, stream, file_size=message.file.size,
+                                    part_size_kb=config.UPLOAD_PART_SIZE)
+                break
+            except errors.FloodWaitError as e:
+                await asyncio.sleep(e.seconds)  # Whole file again, as transfer_process does
+            finally:
+                await stream.close()
+        total_bytes += message.file.size
+    return {'bytes': total_bytes}
+
+async def bench_transfer(args, down, up):
+    """Full transfer_process over a range of fake messages"""
+    import config
+    import transfer
+
+    if not args.keep_delays:
+        async def no_delay(file_size):
+            return None
+        transfer.smart_delay = no_delay
+
+    kinds = ['video', 'file']
+    messages = [make_message(i + 1, args.size_mb * MB, kinds[i % 2]) for i in range(args.files)]
+    user = FakeUserClient(messages, down)
+    bot = FakeBotClient(up)
+
+    session_id = "bench"
+    config.active_sessions[session_id] = {'settings': {'thumbnail_mode': 'original'}}
+    config.is_running = True
+    await transfer.transfer_process(
+        FakeEvent(args.latency_ms / 1000.0), user, bot, "source", "dest",
+        1, args.files, session_id
+    )
+    job = config.last_job_timings
+    return {
+        'bytes': bot.bytes_uploaded,
+        'summary': job.summary_text() if job else None,
+    }
+
+def run_config(spec, args, queue):
+    """Worker process: one configuration, reports throughput/CPU/peak RSS (or the error)"""
+    try:
+        queue.put(measure_config(spec, args))
+    except BaseException:
+        queue.put({'config': spec, 'mode': args.mode_run, 'error': traceback.format_exc()})
+
+def measure_config(spec, args):
+    import logging
+    logging.disable(logging.ERROR)  # Per-file logs/banners would swamp the table
+    import config
+
+    chunk_text, queue_text = spec.split(':')
+    config.CHUNK_SIZE = parse_size(chunk_text)
+    config.QUEUE_SIZE = int(queue_text)
+    random.seed(args.seed)
+
+    links = (args.latency_ms, args.floodwait_rate, args.floodwait_seconds, config.FLOOD_SLEEP_THRESHOLD)
+    down = Link(args.down_mbps, *links)
+    up = Link(args.up_mbps, *links)
+    scenario = bench_stream if args.mode_run == 'stream' else bench_transfer
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    result = asyncio.run(scenario(args, down, up))
+    elapsed = time.perf_counter() - started
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    result.update({
+        'config': spec,
+        'mode': args.mode_run,
+        'seconds': elapsed,
+        'cpu': (usage.ru_utime - usage_before.ru_utime) + (usage.ru_stime - usage_before.ru_stime),
+        'peak_rss_mb': usage.ru_maxrss / 1024.0,  # Linux reports KB
+        'floodwaits': down.floodwaits + up.floodwaits,
+    })
+    return result
+
+def collect_result(worker, queue, poll_seconds=1.0):
+    """Result of one worker, None if the process died without reporting"""
+    while True:
+        try:
+            return queue.get(timeout=poll_seconds)
+        except Empty:
+            if not worker.is_alive():
+                try:
+                    return queue.get(timeout=poll_seconds)  # Put right before exiting
+                except Empty:
+                    return None
+
+def parse_size(text):
+    text = text.strip().upper()
+    for suffix, factor in (('M', MB), ('K', 1024)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * factor)
+    return int(text)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['stream', 'transfer', 'both'], default='both')
+    parser.add_argument('--configs', default='512K:2,2M:3,4M:4', help='CHUNK_SIZE:QUEUE_SIZE list')
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--size-mb', type=int, default=32)
+    parser.add_argument('--down-mbps', type=float, default=40.0, help='Megabits/s')
+    parser.add_argument('--up-mbps', type=float, default=20.0, help='Megabits/s')
+    parser.add_argument('--latency-ms', type=float, default=40.0)
+    parser.add_argument('--floodwait-rate', type=float, default=0.0, help='Probability per request')
+    parser.add_argument('--floodwait-seconds', type=int, default=2)
+    parser.add_argument('--keep-delays', action='store_true', help='Keep smart_delay between files')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    modes = ['stream', 'transfer'] if args.mode == 'both' else [args.mode]
+    context = multiprocessing.get_context('spawn')
+
+    print(f"{'mode':<9} {'config':<8} {'MB/s':>7} {'time s':>8} {'CPU s':>7} {'CPU %':>6} {'peak MB':>8} {'flood':>6}")
+    summaries = []
+    errors = []
+    failed = False
+    for mode in modes:
+        for spec in args.configs.split(','):
+            args.mode_run = mode
+            queue = context.Queue()
+            worker = context.Process(target=run_config, args=(spec, args, queue))
+            worker.start()
+            result = collect_result(worker, queue)
+            worker.join()
+
+            if result is None or 'error' in result:
+                failed = True
+                detail = result['error'].strip().splitlines()[-1] if result else f"exit code {worker.exitcode}"
+                print(f"{mode:<9} {spec:<8} FAILED: {detail}")
+                if result:
+                    errors.append((mode, spec, result['error']))
+                continue
+
+            mb_per_second = result['bytes'] / MB / result['seconds'] if result['seconds'] else 0
+            cpu_percent = 100.0 * result['cpu'] / result['seconds'] if result['seconds'] else 0
+            print(f"{mode:<9} {spec:<8} {mb_per_second:>7.2f} {result['seconds']:>8.2f} "
+                  f"{result['cpu']:>7.2f} {cpu_percent:>6.1f} {result['peak_rss_mb']:>8.1f} {result['floodwaits']:>6}")
+            if result.get('summary'):
+                summaries.append((mode, spec, result['summary']))
+
+    for mode, spec, summary in summaries:
+        print(f"\n[{mode} {spec}]\n{summary}")
+    for mode, spec, error in errors:
+        print(f"\n[{mode} {spec} FAILED]\n{error}", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -57,12 +57,114 @@ current_task = None
 last_file_time = 0
 consecutive_errors = 0
 session_health_check_time = 0
+last_job_timings = None  # Stage split of the last transfer job (/stats)
 
 # --- PDF & THUMBNAIL SETTINGS ---
 PDF_PAGE_REMOVAL_ENABLED = True
 SMART_THUMBNAIL_ENABLED = True
 DEFAULT_THUMBNAIL_SKIP_SECONDS = 10
 
+# Smart thumbnails: decode only keyframes in a window after the skip and
+# pick the best one in-process (falls back to ffmpeg's thumbnail filter)
+SMART_THUMBNAIL_KEYFRAMES = True
+THUMBNAIL_KEYFRAME_WINDOW = 60  # Seconds after the skip offset
+THUMBNAIL_KEYFRAME_MAX = 12  # Keyframes scored at most
+TELEGRAM_THUMB_SIZE = 320  # Telegram keeps thumbnails up to 320px
+TELEGRAM_THUMB_MAX_BYTES = 200 * 1024  # Larger thumbnails are rejected
+TELEGRAM_THUMB_QUALITY = 85  # JPEG quality when a thumbnail is re-encoded
+
+# --- FFMPEG ---
+# ffmpeg/ffprobe run as async subprocesses - at most this many at once
+FFMPEG_MAX_CONCURRENCY = int(os.environ.get("FFMPEG_MAX_CONCURRENCY", 2))
+
+# Generated thumbnails read the video through a loopback range server -
+# only the container index and the blocks around the frame are downloaded
+THUMBNAIL_RANGE_FETCH = True
+THUMBNAIL_RANGE_BLOCK = 256 * 1024  # Must divide 1MB (Telegram file parts)
+THUMBNAIL_RANGE_CACHE_BLOCKS = 32  # 8MB of recently read blocks per video
+
+# Non-MP4 videos (.mkv/.webm/.avi...) are remuxed (-c copy, no re-encode)
+# into fragmented MP4 while downloading, so the .mp4 label is true.
+# The upload only starts once the remux is done (Telegram needs the final
+# size first), so big files are streamed as they are instead
+VIDEO_REMUX_ENABLED = os.environ.get("VIDEO_REMUX_ENABLED", "true").lower() == "true"
+VIDEO_REMUX_MAX_SIZE = int(os.environ.get("VIDEO_REMUX_MAX_MB", 200)) * 1024 * 1024
+VIDEO_REMUX_MEMORY_LIMIT = 64 * 1024 * 1024  # Spooled output spills to disk above this
+
+# Generated thumbnails are reused for reposts of the same video
+THUMBNAIL_CACHE_ENABLED = os.environ.get("THUMBNAIL_CACHE_ENABLED", "true").lower() == "true"
+THUMBNAIL_CACHE_DIR = os.environ.get("THUMBNAIL_CACHE_DIR", "cache/thumbnails")
+THUMBNAIL_CACHE_MAX_BYTES = 200 * 1024 * 1024  # 200MB, least recently used evicted first
+
+# --- PDF FINGERPRINT CACHE ---
+# Per-page hashes/text of already seen PDFs (repeat PDFs skip rendering)
+PDF_CACHE_ENABLED = os.environ.get("PDF_CACHE_ENABLED", "true").lower() == "true"
+PDF_CACHE_PATH = os.environ.get("PDF_CACHE_PATH", "cache/pdf_fingerprints.db")
+PDF_IMAGE_CANDIDATE = 0.6  # New reference vs cached hashes: only pages this similar get rendered
+
+# --- PAGE BLOCKLIST ---
+# Reusable reference pages (ads/watermarks) matched by perceptual hash
+PAGE_BLOCKLIST_PATH = os.environ.get("PAGE_BLOCKLIST_PATH", "cache/page_blocklist.json")
+PAGE_BLOCKLIST_THRESHOLD = 0.85  # PHash similarity (stricter than single screenshot)
+
+# --- SAMPLE PDF MATCHING ---
+# Structural fingerprints first; render only when no byte-identical page was found
+PDF_SAMPLE_RASTER_FALLBACK = True
+
+# --- SCANNED PDFs ---
+# Match image-only pages on their embedded JPEG instead of rendering them
+PDF_EMBEDDED_IMAGE_MODE = True
+
+# --- OCR (keyword search on scanned pages) ---
+PDF_OCR_ENABLED = os.environ.get("PDF_OCR_ENABLED", "true").lower() == "true"
+PDF_OCR_LANG = os.environ.get("PDF_OCR_LANG", "eng")
+PDF_OCR_DPI = 200
+
+# --- PDF KEYWORD MATCHING ---
+# Defaults - sessions override them with keyword prefixes (= ~ !)
+PDF_KEYWORD_WHOLE_WORD = False  # True: "ad" won't match "loading"
+PDF_KEYWORD_FOLD_DIACRITICS = False  # True: "cafe" matches "café"
+PDF_KEYWORD_FOLD_CASE = True  # False: "Promo" won't match "PROMO"
+
+# --- PDF WORKER PROCESSES ---
+# Text extraction runs off the event loop, sharded by page range
+PDF_PROCESS_WORKERS = int(os.environ.get("PDF_PROCESS_WORKERS", os.cpu_count() or 2))
+PDF_TEXT_SHARD_PAGES = 16  # Pages per worker task
+
+# Rewritten PDFs are uploaded straight from a buffer (spills to disk above this)
+PDF_MEMORY_OUTPUT_LIMIT = 64 * 1024 * 1024  # 64MB
+
+# Drop orphaned resources, merge duplicate streams and recompress before upload
+PDF_OPTIMIZE_OUTPUT = True
+
+# --- PHOTO FILTER ---
+# Photos matching the reference screenshot / page blocklist are skipped.
+# A small Telegram preview is hashed first; the full image is only fetched
+# when the preview is close to the reference but not a match
+PHOTO_FILTER_THUMB_MIN_SIDE = 256  # Smallest preview used for PHash (px)
+PHOTO_FILTER_CANDIDATE = 0.6  # Preview similarity below this = different photo
+
+# --- DUPLICATE VIDEOS ---
+# Optional per-transfer filter: skip videos the destination already received,
+# matched on a few frame PHashes read through the range server
+VIDEO_DEDUP_INDEX_PATH = os.environ.get("VIDEO_DEDUP_INDEX_PATH", "cache/video_index.db")
+VIDEO_DEDUP_FRAMES = 5  # Frames sampled at 1/6, 2/6 ... 5/6 of the duration
+VIDEO_DEDUP_MIN_MATCHES = 4  # Frames that must agree
+VIDEO_DEDUP_FRAME_DISTANCE = 10  # Max PHash Hamming distance per frame (of 64 bits)
+VIDEO_DEDUP_DURATION_TOLERANCE = 2.0  # Seconds (or 2% of the duration if larger)
+VIDEO_DEDUP_MIN_FRAME_STD = 8.0  # Flatter frames (black, fades) are ignored
+
+# --- IMAGES ---
+# Images are labelled .jpg, so non-JPEG sources are transcoded (and large
+# ones downscaled) in a thread pool before upload
+IMAGE_RECOMPRESS_ENABLED = os.environ.get("IMAGE_RECOMPRESS_ENABLED", "true").lower() == "true"
+IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", 85))
+IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", 2560))  # Longest side in px
+IMAGE_MAX_SOURCE_BYTES = 50 * 1024 * 1024  # Bigger sources are sent untouched
+IMAGE_MIN_SAVING = 0.10  # JPEG sources are only re-encoded if this saves >= 10%
+IMAGE_MEMORY_OUTPUT_LIMIT = 16 * 1024 * 1024  # Upload buffer spills to disk above this
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", min(4, os.cpu_count() or 2)))
+
 # --- MODE INFO ---
 logger.warning("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
 logger.warning("🔶 BALANCED MODE ENABLED")
@@ -6,7 +6,8 @@ import config
 from keyboards import (
     get_settings_keyboard, get_confirm_keyboard,
     get_skip_keyboard, get_clone_info_keyboard,
-    get_pdf_options_keyboard, get_thumbnail_options_keyboard
+    get_pdf_options_keyboard, get_thumbnail_options_keyboard,
+    get_stats_keyboard, get_blocklist_clear_keyboard
 )
 from transfer import transfer_process
 
@@ -144,6 +145,8 @@ def register_handlers(user_client, bot_client):
     
     @bot_client.on(events.CallbackQuery(pattern=b'bot_stats'))
     async def stats_callback(event):
+        from thumbnail_handler import ffmpeg_status_text
+        
         await event.answer()
         await event.respond(
             f"📊 **EXTREME MODE Statistics**\n"
@@ -154,6 +157,7 @@ def register_handlers(user_client, bot_client):
             f"📤 Upload Parts: **{config.UPLOAD_PART_SIZE // 1024}MB**\n"
             f"🔄 Max Retries: **{config.MAX_RETRIES}**\n"
             f"⏱️ Update Interval: **{config.UPDATE_INTERVAL}s**\n"
+            f"🎬 {ffmpeg_status_text()}\n"
             f"━━━━━━━━━━━━━━━━━━━━\n"
             f"🚀 Status: **{'🟢 Running' if config.is_running else '🔴 Idle'}**\n"
             f"📊 Active Sessions: **{len(config.active_sessions)}**"
@@ -255,7 +259,12 @@ def register_handlers(user_client, bot_client):
             "**Example:**\n"
             "`logo, advertisement, promo`\n\n"
             "Bot will remove all pages containing these keywords.\n\n"
-            "⚠️ This searches for text in PDF pages.",
+            "💡 Optional prefixes (combine freely):\n"
+            "`=` whole words: `=ad, promo` (won't match \"loading\")\n"
+            "`~` ignore accents: `~cafe` (matches \"café\")\n"
+            "`!` match case: `!PROMO` (won't match \"promo\")\n\n"
+            "⚠️ This searches for text in PDF pages\n"
+            "(scanned pages are read with OCR).",
             buttons=get_skip_keyboard(session_id)
         )
     
@@ -288,6 +297,50 @@ def register_handlers(user_client, bot_client):
             buttons=get_skip_keyboard(session_id)
         )
     
+    @bot_client.on(events.CallbackQuery(pattern=r'pdf_blocklist_(.+)'))
+    async def pdf_blocklist_callback(event):
+        session_id = event.data.decode().split('_')[2]
+        if session_id not in config.active_sessions:
+            return await event.answer("❌ Session expired!", alert=True)
+        
+        from page_blocklist import blocklist_size
+        
+        config.active_sessions[session_id]['settings']['pdf_use_blocklist'] = True
+        config.active_sessions[session_id]['step'] = 'pdf_blocklist'
+        await event.edit(
+            "🧱 **Remove by Page Blocklist**\n"
+            "━━━━━━━━━━━━━━━━━━━━\n\n"
+            "✅ Blocklist enabled for this transfer.\n\n"
+            "Every PDF page is checked against **all** saved\n"
+            "reference pages at once (ads, watermarks, promos).\n\n"
+            f"📚 References saved: **{blocklist_size()}**\n"
+            f"🎯 Similarity Threshold: **{int(config.PAGE_BLOCKLIST_THRESHOLD*100)}%**\n\n"
+            "📤 **Send screenshots to add more pages**\n"
+            "(one per message, use Skip when done)",
+            buttons=get_skip_keyboard(session_id)
+        )
+    
+    @bot_client.on(events.CallbackQuery(pattern=r'pdf_sample_(.+)'))
+    async def pdf_sample_callback(event):
+        session_id = event.data.decode().split('_')[2]
+        if session_id not in config.active_sessions:
+            return await event.answer("❌ Session expired!", alert=True)
+        
+        config.active_sessions[session_id]['step'] = 'pdf_sample'
+        await event.edit(
+            "🧬 **Remove by Sample PDF**\n"
+            "━━━━━━━━━━━━━━━━━━━━\n\n"
+            "**How it works:**\n"
+            "1. Send a PDF that contains the unwanted pages\n"
+            "2. Add the page numbers as caption (e.g. `1,12`)\n"
+            "   No caption = learn every page\n"
+            "3. Identical pages are removed from all PDFs\n"
+            "   in milliseconds - no rendering needed\n\n"
+            "💡 Re-encoded copies fall back to image matching.\n\n"
+            "📤 **Send sample PDF now:**",
+            buttons=get_skip_keyboard(session_id)
+        )
+    
     @bot_client.on(events.CallbackQuery(pattern=r'set_thumb_(.+)'))
     async def set_thumb_callback(event):
         session_id = event.data.decode().split('_')[2]
@@ -346,6 +399,63 @@ def register_handlers(user_client, bot_client):
             buttons=get_settings_keyboard(session_id)
         )
     
+    @bot_client.on(events.CallbackQuery(pattern=r'set_vdedup_(.+)'))
+    async def set_vdedup_callback(event):
+        session_id = event.data.decode().split('_')[2]
+        if session_id not in config.active_sessions:
+            return await event.answer("❌ Session expired!", alert=True)
+        
+        from video_index import index_size
+        
+        settings = config.active_sessions[session_id]['settings']
+        settings['video_dedup'] = not settings.get('video_dedup')
+        
+        if settings['video_dedup']:
+            await event.answer("🎞️ Duplicate videos will be skipped", alert=False)
+            text = (
+                "✅ **Duplicate Videos: Skip**\n"
+                "━━━━━━━━━━━━━━━━━━━━\n\n"
+                "Videos the destination already received are skipped,\n"
+                "including re-encoded copies (same frames & length).\n\n"
+                f"📚 Videos indexed: **{index_size()}**\n\n"
+                "⚠️ Re-encoded copies need FFmpeg installed!"
+            )
+        else:
+            await event.answer("🎞️ Duplicate filter off", alert=False)
+            text = "❎ **Duplicate Videos: Send All**"
+        
+        await event.edit(text, buttons=get_settings_keyboard(session_id))
+    
+    @bot_client.on(events.CallbackQuery(pattern=r'set_pfilter_(.+)'))
+    async def set_pfilter_callback(event):
+        session_id = event.data.decode().split('_')[2]
+        if session_id not in config.active_sessions:
+            return await event.answer("❌ Session expired!", alert=True)
+        
+        from page_blocklist import blocklist_size
+        
+        settings = config.active_sessions[session_id]['settings']
+        settings['photo_filter'] = not settings.get('photo_filter')
+        
+        if settings['photo_filter']:
+            await event.answer("📸 Matching photos will be skipped", alert=False)
+            screenshot = "✅" if settings.get('pdf_reference_image') else "❌"
+            blocklist = "✅" if settings.get('pdf_use_blocklist') else "❌"
+            text = (
+                "✅ **Matching Photos: Skip**\n"
+                "━━━━━━━━━━━━━━━━━━━━\n\n"
+                "Photos are checked against the same references\n"
+                "as PDF pages (preview first, full image only if close):\n\n"
+                f"📸 Screenshot: {screenshot}\n"
+                f"🧱 Page Blocklist: {blocklist} ({blocklist_size()} pages)\n\n"
+                "💡 Set references under **PDF: Remove Pages**."
+            )
+        else:
+            await event.answer("📸 Photo filter off", alert=False)
+            text = "❎ **Matching Photos: Send All**"
+        
+        await event.edit(text, buttons=get_settings_keyboard(session_id))
+    
     @bot_client.on(events.CallbackQuery(pattern=r'skip_(.+)'))
     async def skip_callback(event):
         session_id = event.data.decode().split('_')[1]
@@ -367,6 +477,10 @@ def register_handlers(user_client, bot_client):
             config.active_sessions[session_id]['step'] = 'settings'
         elif step == 'pdf_image':
             config.active_sessions[session_id]['step'] = 'settings'
+        elif step == 'pdf_blocklist':
+            config.active_sessions[session_id]['step'] = 'settings'
+        elif step == 'pdf_sample':
+            config.active_sessions[session_id]['step'] = 'settings'
         
         await event.answer("⏭️ Skipped!", alert=False)
         await event.edit(
@@ -545,7 +659,6 @@ def register_handlers(user_client, bot_client):
         elif step == 'pdf_image' and event.photo:
             # User sent screenshot for PDF page matching
             import tempfile
-            from pdf_handler import find_matching_pages_by_image
             
             try:
                 # Download uploaded image
@@ -591,17 +704,133 @@ def register_handlers(user_client, bot_client):
                     buttons=get_skip_keyboard(session_id)
                 )
         
+        elif step == 'pdf_blocklist' and event.photo:
+            # User sent a page screenshot for the reusable blocklist
+            import tempfile
+            from pdf_handler import add_blocklist_reference
+            
+            image_path = None
+            try:
+                temp_dir = tempfile.gettempdir()
+                image_path = await bot_client.download_media(
+                    event.message,
+                    file=os.path.join(temp_dir, f"blocklist_{session_id}_{event.message.id}.jpg")
+                )
+                
+                added, size = await add_blocklist_reference(
+                    image_path,
+                    label=f"msg_{event.message.id}"
+                )
+                
+                await event.respond(
+                    ("✅ **Page added to blocklist!**\n\n" if added
+                     else "ℹ️ **Page already in blocklist**\n\n") +
+                    f"📚 References saved: **{size}**\n\n"
+                    "Send another screenshot or use Skip when done.",
+                    buttons=get_skip_keyboard(session_id)
+                )
+            
+            except Exception as img_err:
+                config.logger.error(f"❌ Blocklist image error: {img_err}")
+                await event.respond(
+                    f"❌ **Image Error**\n\n"
+                    f"Could not add screenshot to blocklist.\n\n"
+                    f"Error: `{str(img_err)[:100]}`",
+                    buttons=get_skip_keyboard(session_id)
+                )
+            
+            finally:
+                if image_path and os.path.exists(image_path):
+                    os.remove(image_path)
+        
+        elif step == 'pdf_sample' and event.document:
+            # User sent a sample PDF with the unwanted pages
+            import tempfile
+            from pdf_handler import learn_sample_fingerprints, parse_page_range
+            
+            sample_path = None
+            try:
+                if 'pdf' not in (event.file.mime_type or '') and not (event.file.name or '').lower().endswith('.pdf'):
+                    return await event.respond(
+                        "❌ **Not a PDF!**\n\n"
+                        "Send the sample as a PDF document.",
+                        buttons=get_skip_keyboard(session_id)
+                    )
+                
+                pages = None
+                if event.text:
+                    pages = parse_page_range(event.text)
+                    if not pages:
+                        return await event.respond(
+                            "❌ **Invalid page numbers in caption!**\n\n"
+                            "Use: `1,3,5` or `1-5` or no caption for all pages",
+                            buttons=get_skip_keyboard(session_id)
+                        )
+                
+                temp_dir = tempfile.gettempdir()
+                sample_path = await bot_client.download_media(
+                    event.message,
+                    file=os.path.join(temp_dir, f"sample_{session_id}.pdf")
+                )
+                
+                learned = await learn_sample_fingerprints(sample_path, pages)
+                
+                if not learned['structural']:
+                    return await event.respond(
+                        "❌ **No pages learned!**\n\n"
+                        "Check the page numbers in the caption.",
+                        buttons=get_skip_keyboard(session_id)
+                    )
+                
+                session['settings']['pdf_sample_fingerprints'] = learned
+                session['step'] = 'settings'
+                await event.respond(
+                    "✅ **Sample PDF learned!**\n"
+                    "━━━━━━━━━━━━━━━━━━━━\n\n"
+                    f"🧬 Page fingerprints: **{len(learned['structural'])}**\n"
+                    f"🖼️ Image fallback: **{'Ready' if learned['phash'] else 'Unavailable'}**\n\n"
+                    "💡 Identical pages will be removed during transfer.",
+                    buttons=get_settings_keyboard(session_id)
+                )
+            
+            except Exception as pdf_err:
+                config.logger.error(f"❌ Sample PDF error: {pdf_err}")
+                await event.respond(
+                    f"❌ **Sample Error**\n\n"
+                    f"Could not read sample PDF.\n\n"
+                    f"Error: `{str(pdf_err)[:100]}`",
+                    buttons=get_skip_keyboard(session_id)
+                )
+            
+            finally:
+                if sample_path and os.path.exists(sample_path):
+                    os.remove(sample_path)
+        
         elif step == 'pdf_keywords':
-            keywords = [k.strip() for k in event.text.split(',') if k.strip()]
+            keyword_text = event.text.strip()
+            prefixes = set()
+            while keyword_text[:1] in ('=', '~', '!'):
+                prefixes.add(keyword_text[0])
+                keyword_text = keyword_text[1:]
+            keywords = [k.strip() for k in keyword_text.split(',') if k.strip()]
             
             if keywords:
+                # Options without their prefix fall back to the config default
                 session['settings']['pdf_keywords'] = keywords
+                session['settings']['pdf_keywords_whole_word'] = True if '=' in prefixes else None
+                session['settings']['pdf_keywords_fold_diacritics'] = True if '~' in prefixes else None
+                session['settings']['pdf_keywords_fold_case'] = False if '!' in prefixes else None
+                modes = [
+                    mode for prefix, mode in (('=', 'whole words'), ('~', 'ignoring accents'), ('!', 'case-sensitive'))
+                    if prefix in prefixes
+                ]
                 session['step'] = 'settings'
                 await event.respond(
                     "✅ **PDF keywords set!**\n\n"
                     f"Will remove pages containing:\n"
                     f"`{', '.join(keywords)}`\n\n"
-                    f"Keywords: `{len(keywords)}`",
+                    f"Keywords: `{len(keywords)}`"
+                    f"{' (' + ', '.join(modes) + ')' if modes else ''}",
                     buttons=get_settings_keyboard(session_id)
                 )
             else:
@@ -642,6 +871,22 @@ def register_handlers(user_client, bot_client):
     
     @bot_client.on(events.NewMessage(pattern='/stats'))
     async def stats_handler(event):
+        from page_blocklist import blocklist_size
+        from thumbnail_handler import ffmpeg_status_text
+        from thumbnail_cache import cache_usage
+        from video_index import index_size
+        from utils import human_readable_size
+        
+        thumb_count, thumb_bytes = cache_usage()
+        
+        last_job = ""
+        if config.last_job_timings and config.last_job_timings.summary_text():
+            last_job = (
+                f"\n━━━━━━━━━━━━━━━━━━━━\n"
+                f"🧾 Last job ({config.last_job_timings.files} messages):\n"
+                f"{config.last_job_timings.summary_text()}"
+            )
+        
         await event.respond(
             f"📊 **EXTREME MODE Stats**\n"
             f"━━━━━━━━━━━━━━━━━━━━\n"
@@ -650,11 +895,43 @@ def register_handlers(user_client, bot_client):
             f"📤 Upload: **{config.UPLOAD_PART_SIZE // 1024}MB parts**\n"
             f"🔄 Retries: **{config.MAX_RETRIES}**\n"
             f"⏱️ Updates: **Every {config.UPDATE_INTERVAL}s**\n"
+            f"🧱 Blocklist: **{blocklist_size()} pages**\n"
+            f"🎬 {ffmpeg_status_text()}\n"
+            f"🖼️ Thumb cache: **{thumb_count} ({human_readable_size(thumb_bytes)})**\n"
+            f"🎞️ Video index: **{index_size()} videos**\n"
             f"━━━━━━━━━━━━━━━━━━━━\n"
             f"🚀 Status: **{'Running' if config.is_running else 'Idle'}**\n"
             f"📊 Sessions: **{len(config.active_sessions)}**"
+            f"{last_job}",
+            buttons=get_stats_keyboard(blocklist_size())
         )
     
+    @bot_client.on(events.CallbackQuery(pattern=b'^blocklist_clear$'))
+    async def blocklist_clear_callback(event):
+        from page_blocklist import blocklist_size
+        
+        await event.answer()
+        await event.respond(
+            f"🗑️ **Clear Page Blocklist?**\n\n"
+            f"All **{blocklist_size()}** saved reference pages will be removed.\n"
+            f"This cannot be undone.",
+            buttons=get_blocklist_clear_keyboard()
+        )
+    
+    @bot_client.on(events.CallbackQuery(pattern=b'^blocklist_clear_(yes|no)$'))
+    async def blocklist_clear_confirm_callback(event):
+        from page_blocklist import blocklist_size, clear_blocklist
+        
+        if event.data == b'blocklist_clear_no':
+            await event.answer("👍 Blocklist kept")
+            return await event.edit(f"🧱 Blocklist kept: **{blocklist_size()} pages**")
+        
+        removed = blocklist_size()
+        clear_blocklist()
+        config.logger.info(f"🗑️ Page blocklist cleared ({removed} references)")
+        await event.answer("🗑️ Blocklist cleared", alert=True)
+        await event.edit(f"🗑️ **Page Blocklist cleared** ({removed} pages removed)")
+    
     @bot_client.on(events.NewMessage(pattern='/stop'))
     async def stop_handler(event):
         if not config.is_running:
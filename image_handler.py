@@ -0,0 +1,139 @@
+import io
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+import config
+import metrics
+from stream import progress_callback, SpooledUploadBuffer
+from utils import human_readable_size
+
+# Pillow releases the GIL while decoding/encoding, so threads scale here
+_thread_pool = None
+
+def _get_thread_pool():
+    """Shared threads for image transcoding (created on first use)"""
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=config.IMAGE_WORKERS, thread_name_prefix="image"
+        )
+        config.logger.info(f"⚙️ Image thread pool: {config.IMAGE_WORKERS} workers")
+    return _thread_pool
+
+def shutdown_thread_pool():
+    """Stop image threads (called on bot shutdown)"""
+    global _thread_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+
+def _to_rgb(image):
+    """RGB for JPEG: transparency flattened onto white, CMYK/palette/16-bit converted"""
+    if image.mode == 'P':
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    if image.mode in ('RGBA', 'LA', 'PA'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    if image.mode == 'I;16':
+        image = image.point(lambda value: value / 256).convert('L')
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    return image
+
+# ICC header colour space signature expected for each output mode
+_ICC_COLOR_SPACES = {'RGB': b'RGB ', 'L': b'GRAY'}
+
+def _matching_icc_profile(icc_profile, mode):
+    """The profile if it describes the output mode (a CMYK profile on RGB pixels shifts colours)"""
+    if icc_profile and icc_profile[16:20] == _ICC_COLOR_SPACES.get(mode):
+        return icc_profile
+    return None
+
+def recompress_image(data, file_name):
+    """
+    Transcode image bytes to JPEG (runs in a worker thread)
+    Longest side capped at IMAGE_MAX_DIMENSION, EXIF orientation applied,
+    metadata dropped (ICC profile kept when it still fits the output colour space)
+    Returns: (SpooledUploadBuffer at 0, size) or (None, 0) to send the original
+    """
+    max_side = config.IMAGE_MAX_DIMENSION
+    image = Image.open(io.BytesIO(data))
+
+    if getattr(image, 'is_animated', False):
+        return None, 0  # JPEG would drop the animation
+
+    source_format = image.format
+    original_size = image.size
+    # JPEG decoder can downscale by 1/2..1/8 while decoding (much faster)
+    image.draft('RGB', (max_side, max_side))
+    icc_profile = image.info.get('icc_profile')
+
+    image = ImageOps.exif_transpose(image)
+    image = _to_rgb(image)
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    encoded = io.BytesIO()
+    save_args = {'quality': config.IMAGE_JPEG_QUALITY, 'optimize': True, 'progressive': True}
+    icc_profile = _matching_icc_profile(icc_profile, image.mode)
+    if icc_profile:
+        save_args['icc_profile'] = icc_profile
+    image.save(encoded, 'JPEG', **save_args)
+    size = encoded.tell()
+
+    # Re-encoding a JPEG costs quality - only worth it for a real saving
+    if source_format == 'JPEG' and size > len(data) * (1 - config.IMAGE_MIN_SAVING):
+        return None, 0
+
+    config.logger.info(
+        f"🖼️ Image {source_format} {original_size[0]}x{original_size[1]} -> "
+        f"JPEG {image.width}x{image.height}: "
+        f"{human_readable_size(len(data))} -> {human_readable_size(size)}"
+    )
+    output = SpooledUploadBuffer(file_name, max_size=config.IMAGE_MEMORY_OUTPUT_LIMIT)
+    output.write(encoded.getbuffer())
+    output.seek(0)
+    return output, size
+
+def upload_buffer(data, file_name):
+    """Image bytes already in memory as a send_file-ready buffer"""
+    output = SpooledUploadBuffer(file_name, max_size=config.IMAGE_MEMORY_OUTPUT_LIMIT)
+    output.write(data)
+    output.seek(0)
+    return output
+
+async def process_image(client, message, file_name, start_time, status_msg, data=None):
+    """
+    Download an image and recompress it to JPEG off the event loop
+    data: image bytes already downloaded (e.g. by the photo filter)
+    Returns: (buffer, size) - the original bytes if recompression did not pay off,
+    (None, 0) if the source is too big to hold in memory
+    """
+    if data is None:
+        file_size = message.file.size or 0
+        if file_size > config.IMAGE_MAX_SOURCE_BYTES:
+            return None, 0
+
+        async def on_progress(current, total):
+            await progress_callback(current, total or file_size, start_time, file_name, status_msg)
+
+        data = await client.download_media(message, file=bytes, progress_callback=on_progress)
+        if not data:
+            return None, 0
+        metrics.BYTES_DOWNLOADED.inc(len(data), source='image')
+
+    loop = asyncio.get_running_loop()
+    try:
+        output, size = await loop.run_in_executor(
+            _get_thread_pool(), recompress_image, data, file_name
+        )
+    except Exception as e:
+        config.logger.warning(f"⚠️ Image recompression failed, sending original: {e}")
+        output = None
+
+    if output is None:
+        # Already downloaded - upload these bytes instead of fetching them again
+        output = upload_buffer(data, file_name)
+        size = len(data)
+    return output, size
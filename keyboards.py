@@ -16,6 +16,10 @@ def get_settings_keyboard(session_id):
             Button.inline("📄 PDF: Remove Pages", f"set_pdf_{session_id}"),
             Button.inline("🖼️ Thumbnail Options", f"set_thumb_{session_id}")
         ],
+        [
+            Button.inline("🎞️ Skip Duplicate Videos", f"set_vdedup_{session_id}"),
+            Button.inline("📸 Skip Matching Photos", f"set_pfilter_{session_id}")
+        ],
         [
             Button.inline("✅ Done - Start Transfer", f"confirm_{session_id}"),
             Button.inline("❌ Cancel", f"cancel_{session_id}")
@@ -44,6 +48,13 @@ def get_confirm_keyboard(session_id, settings):
     if settings.get('pdf_reference_image'):
         settings_text += f"📸 PDF Image-based Removal:\nScreenshot uploaded ✅\n\n"
     
+    if settings.get('pdf_use_blocklist'):
+        settings_text += f"🧱 PDF Page Blocklist: Enabled ✅\n\n"
+    
+    if settings.get('pdf_sample_fingerprints'):
+        learned = len(settings['pdf_sample_fingerprints'].get('structural', []))
+        settings_text += f"🧬 PDF Sample Pages: {learned} learned ✅\n\n"
+    
     thumb_mode = settings.get('thumbnail_mode', 'original')
     if thumb_mode == 'generate':
         settings_text += f"🖼️ Thumbnail: Generate from video\n\n"
@@ -53,8 +64,17 @@ def get_confirm_keyboard(session_id, settings):
     else:
         settings_text += f"🖼️ Thumbnail: Use Original\n\n"
     
+    if settings.get('video_dedup'):
+        settings_text += f"🎞️ Duplicate Videos: Skipped ✅\n\n"
+    
+    if settings.get('photo_filter'):
+        settings_text += f"📸 Matching Photos: Skipped ✅\n\n"
+    
     if not any([settings.get('find_name'), settings.get('find_cap'), settings.get('extra_cap'), 
-                settings.get('pdf_pages'), settings.get('thumbnail_mode') != 'original']):
+                settings.get('pdf_pages'), settings.get('pdf_keywords'), settings.get('pdf_reference_image'),
+                settings.get('pdf_use_blocklist'), settings.get('pdf_sample_fingerprints'),
+                settings.get('thumbnail_mode') != 'original',
+                settings.get('video_dedup'), settings.get('photo_filter')]):
         settings_text += "⚠️ No modifications set\n\n"
     
     return settings_text, [
@@ -88,12 +108,29 @@ def get_clone_info_keyboard():
         [Button.inline("📊 Bot Stats", "bot_stats")]
     ]
 
+def get_stats_keyboard(blocklist_size):
+    """Actions under /stats (None if there is nothing to manage)"""
+    if not blocklist_size:
+        return None
+    return [
+        [Button.inline("🗑️ Clear Page Blocklist", "blocklist_clear")]
+    ]
+
+def get_blocklist_clear_keyboard():
+    """Confirm wiping the page blocklist"""
+    return [
+        [Button.inline("✅ Yes, clear it", "blocklist_clear_yes"),
+         Button.inline("❌ Keep it", "blocklist_clear_no")]
+    ]
+
 def get_pdf_options_keyboard(session_id):
     """PDF manipulation options"""
     return [
         [Button.inline("🔢 Remove by Page Numbers", f"pdf_pages_{session_id}")],
         [Button.inline("🔍 Remove by Keywords", f"pdf_keywords_{session_id}")],
         [Button.inline("📸 Remove by Screenshot", f"pdf_image_{session_id}")],
+        [Button.inline("🧱 Remove by Page Blocklist", f"pdf_blocklist_{session_id}")],
+        [Button.inline("🧬 Remove by Sample PDF", f"pdf_sample_{session_id}")],
         [Button.inline("⏭️ Skip PDF Settings", f"skip_{session_id}")],
         [Button.inline("❌ Cancel", f"cancel_{session_id}")]
     ]
@@ -0,0 +1,112 @@
+import unicodedata
+from collections import deque
+from functools import lru_cache
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton - finds every keyword in a single pass over the text
+    fold_case: case-insensitive matching (casefold)
+    fold_diacritics: "café" matches "cafe"
+    whole_word: keyword must not be glued to letters/digits on either side
+    """
+    def __init__(self, keywords, fold_case=True, fold_diacritics=False, whole_word=False):
+        self.keywords = list(keywords)
+        self.fold_case = fold_case
+        self.fold_diacritics = fold_diacritics
+        self.whole_word = whole_word
+
+        # Trie: transitions, failure links, outputs (keyword index, pattern length)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for index, keyword in enumerate(self.keywords):
+            pattern = self.normalize(keyword)
+            if not pattern:
+                continue
+
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][char] = next_node
+                node = next_node
+            self._out[node].append((index, len(pattern)))
+
+        # Breadth-first failure links (root children fail to root)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def normalize(self, text):
+        """Apply the configured case/diacritic folding"""
+        if self.fold_diacritics:
+            text = "".join(
+                c for c in unicodedata.normalize('NFKD', text)
+                if not unicodedata.combining(c)
+            )
+        if self.fold_case:
+            text = text.casefold()
+        return text
+
+    def _is_boundary(self, text, start, end):
+        """True if text[start:end] is not part of a longer word"""
+        before = text[start - 1] if start > 0 else ""
+        after = text[end] if end < len(text) else ""
+        return not (before.isalnum() or before == "_" or after.isalnum() or after == "_")
+
+    def iter_matches(self, text):
+        """
+        Yield (keyword, start, end) for every match in the normalized text
+        """
+        text = self.normalize(text or "")
+        goto, fail, out = self._goto, self._fail, self._out
+
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            for index, length in out[node]:
+                start = position - length + 1
+                if self.whole_word and not self._is_boundary(text, start, position + 1):
+                    continue
+                yield self.keywords[index], start, position + 1
+
+    def first_match(self, text):
+        """First keyword found in text (or None)"""
+        for keyword, _, _ in self.iter_matches(text):
+            return keyword
+        return None
+
+    def find_all(self, text):
+        """All distinct keywords found in text, in order of appearance"""
+        found = []
+        for keyword, _, _ in self.iter_matches(text):
+            if keyword not in found:
+                found.append(keyword)
+        return found
+
+@lru_cache(maxsize=32)
+def _compiled(keywords, fold_case, fold_diacritics, whole_word):
+    return KeywordMatcher(keywords, fold_case, fold_diacritics, whole_word)
+
+def get_matcher(keywords, fold_case=True, fold_diacritics=False, whole_word=False):
+    """
+    Compiled matcher for a keyword list - built once, reused for every page/file
+    """
+    return _compiled(tuple(keywords), fold_case, fold_diacritics, whole_word)
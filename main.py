@@ -16,6 +16,11 @@ from aiohttp import web
 
 import config
 from handlers import register_handlers
+from pdf_handler import shutdown_process_pool
+from thumbnail_handler import kill_running_processes, probe_ffmpeg_capabilities, ffmpeg_status_text
+from remote_media import stop_server
+from image_handler import shutdown_thread_pool as shutdown_image_pool
+from metrics import handle_metrics, monitor_loop_lag
 
 # --- SAFE CLIENT SETUP (WITH SESSION PROTECTION) ---
 user_client = TelegramClient(
@@ -91,6 +96,16 @@ async def shutdown(signal_received=None):
     if config.current_task:
         config.current_task.cancel()
     
+    # Stop PDF worker processes
+    shutdown_process_pool()
+    
+    # Stop image threads
+    shutdown_image_pool()
+    
+    # Stop ffmpeg/ffprobe children
+    kill_running_processes()
+    await stop_server()
+    
     # Save sessions
     try:
         if user_client.is_connected():
@@ -108,12 +123,14 @@ async def handle(request):
         text=f"🔒 SAFE MODE v3.0 - Status: {status}\n"
              f"⚡ Chunk: 512KB × 2 = 1MB Buffer\n"
              f"🛡️ Ban Prevention: ACTIVE\n"
-             f"📊 Active Sessions: {len(config.active_sessions)}"
+             f"📊 Active Sessions: {len(config.active_sessions)}\n"
+             f"🎬 {ffmpeg_status_text()}"
     )
 
 async def start_web_server():
     app = web.Application()
     app.router.add_get('/', handle)
+    app.router.add_get('/metrics', handle_metrics)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, '0.0.0.0', config.PORT)
@@ -146,6 +163,9 @@ if __name__ == '__main__':
         bot_client.start(bot_token=config.BOT_TOKEN)
         config.logger.info("✅ Bot client connected")
         
+        # Probe ffmpeg/ffprobe once (per-file checks use the cached result)
+        probe_ffmpeg_capabilities()
+        
         # Register all handlers
         register_handlers(user_client, bot_client)
         config.logger.info("✅ Handlers registered")
@@ -153,6 +173,9 @@ if __name__ == '__main__':
         # Start web server
         loop.create_task(start_web_server())
         
+        # Event loop lag for /metrics
+        loop.create_task(monitor_loop_lag())
+        
         # Start session health monitor
         loop.create_task(session_health_check())
         config.logger.info("✅ Session health monitor started")
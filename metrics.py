@@ -0,0 +1,256 @@
+import abc
+import json
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from aiohttp import web
+import config
+
+# Minimal Prometheus text exposition (format 0.0.4) - counters, gauges and
+# histograms with labels, no extra dependency. Everything lives in this
+# process, so a plain registry and one lock are enough.
+_registry = []
+_lock = threading.Lock()
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric(abc.ABC):
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        with _lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    @abc.abstractmethod
+    def _samples(self):
+        """Exposition lines for every series of this metric"""
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+class Counter(_Metric):
+    """Monotonic total"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        if not self.label_names:
+            self._values[()] = 0  # Unlabelled series exist from the start
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+class Gauge(Counter):
+    """Value that goes up and down"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    """Cumulative buckets + sum + count"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=None):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        if not self.label_names:
+            self._values[()] = ([0] * len(self.buckets), 0.0)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, counts):
+                labels = _format_labels(self.label_names, key, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+def render():
+    """Every registered metric in Prometheus text format"""
+    with _lock:
+        lines = []
+        for metric in _registry:
+            lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+# --- BOT METRICS ---
+_SECONDS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+_MB = 1024 * 1024
+
+BYTES_DOWNLOADED = Counter(
+    'tgbot_bytes_downloaded_total', 'Bytes downloaded from Telegram', ['source']
+)
+BYTES_UPLOADED = Counter('tgbot_bytes_uploaded_total', 'Bytes uploaded to the destination')
+FILES = Counter('tgbot_files_total', 'Messages handled by result', ['result'])
+FILE_SECONDS = Histogram(
+    'tgbot_file_transfer_seconds', 'Wall time per transferred file', buckets=_SECONDS
+)
+FILE_THROUGHPUT = Histogram(
+    'tgbot_file_throughput_bytes_per_second', 'Per-file transfer speed',
+    buckets=(0.1 * _MB, 0.25 * _MB, 0.5 * _MB, 1 * _MB, 2 * _MB, 5 * _MB, 10 * _MB, 20 * _MB, 50 * _MB)
+)
+STREAM_QUEUE_DEPTH = Gauge(
+    'tgbot_stream_queue_depth', 'Chunks waiting in the download->upload stream buffer'
+)
+FLOOD_WAITS = Counter('tgbot_floodwait_total', 'FloodWait errors received')
+FLOOD_WAIT_SECONDS = Counter('tgbot_floodwait_seconds_total', 'Seconds slept because of FloodWait')
+RETRIES = Counter('tgbot_retries_total', 'Transfer attempts retried', ['reason'])
+STAGE_SECONDS = Histogram(
+    'tgbot_stage_seconds', 'Latency of processing stages (PDF, thumbnail, remux, ...)',
+    ['stage'], buckets=_SECONDS
+)
+LOOP_LAG = Histogram(
+    'tgbot_event_loop_lag_seconds', 'Extra delay of a scheduled event loop wakeup',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+async def monitor_loop_lag(interval=1.0):
+    """Background task: how late the event loop wakes a sleeping task"""
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - scheduled - interval))
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+def observe_stages(timings, prefix):
+    """Feed a {stage: seconds} dict (e.g. process_pdf timings) into the stage histogram"""
+    for stage, seconds in (timings or {}).items():
+        observe_stage(f"{prefix}_{stage}", seconds)
+
+# --- PER-FILE STAGE TIMINGS ---
+# Which bucket each stage counts towards in the job summary
+STAGE_GROUPS = {
+    'refresh': 'api', 'status_edit': 'api',
+    'download_wait': 'download', 'pdf_download': 'download',
+    'upload': 'upload',
+    'thumbnail': 'processing', 'pdf_analysis': 'processing', 'remux': 'processing',
+    'image': 'processing', 'photo_filter': 'processing', 'video_signature': 'processing',
+    'cooldown': 'delays', 'retry_wait': 'delays', 'floodwait': 'delays',
+}
+
+class FileTimings:
+    """Wall time of one message split into stages (also fed to tgbot_stage_seconds)"""
+    def __init__(self, message_id):
+        self.message_id = message_id
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        observe_stage(name, seconds)
+
+    def finish(self, result, file_name=None, file_size=0):
+        """Close the record: count the result and log it as one JSON line"""
+        total = time.perf_counter() - self.started
+        self.stages['other'] = max(0.0, total - sum(self.stages.values()))
+        FILES.inc(result=result)
+        config.logger.info(json.dumps({
+            'event': 'file_timing',
+            'message_id': self.message_id,
+            'file': file_name,
+            'bytes': file_size,
+            'result': result,
+            'total': round(total, 3),
+            'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+        }, ensure_ascii=False))
+        return total
+
+class JobTimings:
+    """Stage totals over a whole transfer job"""
+    def __init__(self):
+        self.stages = {}
+        self.files = 0
+
+    def add_file(self, file_timings):
+        self.files += 1
+        self.add(file_timings.stages)
+
+    def add(self, stages):
+        for name, seconds in stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def groups(self):
+        """Seconds per group (download / upload / processing / delays / api / other)"""
+        totals = {}
+        for name, seconds in self.stages.items():
+            group = STAGE_GROUPS.get(name, 'other')
+            totals[group] = totals.get(group, 0.0) + seconds
+        return totals
+
+    def summary_text(self, top=5):
+        """'upload 52% · delays 30% · ...' plus the dominant group"""
+        total = sum(self.stages.values())
+        if total <= 0:
+            return None
+        groups = sorted(self.groups().items(), key=lambda item: item[1], reverse=True)
+        split = " · ".join(f"{name} {seconds / total:.0%}" for name, seconds in groups)
+        stages = sorted(self.stages.items(), key=lambda item: item[1], reverse=True)[:top]
+        detail = " · ".join(f"{name} {seconds:.1f}s" for name, seconds in stages)
+        return f"⏱️ Split: `{split}`\n🔎 Bound by: **{groups[0][0]}**\n📋 Top stages: `{detail}`"
+
+async def handle_metrics(request):
+    """aiohttp handler for /metrics"""
+    return web.Response(
+        body=render().encode(),
+        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+    )
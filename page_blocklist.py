@@ -0,0 +1,151 @@
+import os
+import json
+import threading
+import config
+
+def hamming(a, b):
+    """Hamming distance between two integer hashes"""
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes (Hamming metric)
+    Radius queries only visit children within [d - r, d + r] of each node
+    """
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, hash_value, item):
+        """Insert a hash with its payload"""
+        node = [hash_value, item, {}]
+        self.size += 1
+
+        if self.root is None:
+            self.root = node
+            return
+
+        current = self.root
+        while True:
+            distance = hamming(hash_value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def query(self, hash_value, max_distance):
+        """
+        All entries within max_distance of hash_value
+        Returns: list of (distance, item) sorted by distance
+        """
+        if self.root is None:
+            return []
+
+        results = []
+        stack = [self.root]
+        while stack:
+            node_hash, item, children = stack.pop()
+            distance = hamming(hash_value, node_hash)
+            if distance <= max_distance:
+                results.append((distance, item))
+
+            low, high = distance - max_distance, distance + max_distance
+            for child_distance, child in children.items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+
+        results.sort(key=lambda r: r[0])
+        return results
+
+# --- PERSISTENT BLOCKLIST ---
+_tree = None
+_entries = []
+_lock = threading.Lock()
+
+def _load():
+    """Load blocklist from disk on first use"""
+    global _tree, _entries
+    if _tree is not None:
+        return
+
+    _tree = BKTree()
+    _entries = []
+    if os.path.exists(config.PAGE_BLOCKLIST_PATH):
+        try:
+            with open(config.PAGE_BLOCKLIST_PATH, 'r') as f:
+                _entries = json.load(f)
+        except Exception as e:
+            config.logger.error(f"❌ Blocklist load error: {e}")
+            _entries = []
+
+    for entry in _entries:
+        _tree.add(int(entry['hash'], 16), entry.get('label'))
+
+    config.logger.info(f"🧱 Page blocklist: {len(_entries)} reference(s)")
+
+def _save():
+    """Write blocklist atomically"""
+    path = config.PAGE_BLOCKLIST_PATH
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(_entries, f)
+    os.replace(temp_path, path)
+
+def add_reference(packed_hash, label=None):
+    """
+    Add a packed perceptual hash to the blocklist
+    Returns: (added, blocklist_size) - added is False for exact duplicates
+    """
+    hash_value = int.from_bytes(bytes(packed_hash), 'big')
+    with _lock:
+        _load()
+        if _tree.query(hash_value, 0):
+            return False, _tree.size
+
+        _entries.append({'hash': format(hash_value, 'x'), 'label': label})
+        _tree.add(hash_value, label)
+        _save()
+        return True, _tree.size
+
+def match_pages(page_hashes, threshold=None):
+    """
+    Check every page hash against the whole blocklist
+    page_hashes: list of packed hashes (index 0 = page 1)
+    threshold: similarity 0.0-1.0 (default PAGE_BLOCKLIST_THRESHOLD)
+    Returns: list of (page_num, similarity, label)
+    """
+    if threshold is None:
+        threshold = config.PAGE_BLOCKLIST_THRESHOLD
+
+    with _lock:
+        _load()
+        if not _tree.size:
+            return []
+
+        matches = []
+        for page_num, packed_hash in enumerate(page_hashes, start=1):
+            hash_bits = len(packed_hash) * 8
+            max_distance = int((1.0 - threshold) * hash_bits)
+            hits = _tree.query(int.from_bytes(bytes(packed_hash), 'big'), max_distance)
+            if hits:
+                distance, label = hits[0]
+                matches.append((page_num, 1.0 - distance / float(hash_bits), label))
+        return matches
+
+def blocklist_size():
+    """Number of references in the blocklist"""
+    with _lock:
+        _load()
+        return _tree.size
+
+def clear_blocklist():
+    """Remove every reference"""
+    global _tree, _entries
+    with _lock:
+        _tree = BKTree()
+        _entries = []
+        _save()
@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import config
+
+# Single shared connection - all writes are tiny, a lock keeps them serialized
+_connection = None
+_lock = threading.Lock()
+
+def _get_connection():
+    """Open (and create) the fingerprint database on first use"""
+    global _connection
+    if _connection is None:
+        db_dir = os.path.dirname(config.PDF_CACHE_PATH)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        _connection = sqlite3.connect(config.PDF_CACHE_PATH, check_same_thread=False)
+        _connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                content_hash TEXT PRIMARY KEY,
+                page_count INTEGER,
+                created REAL
+            );
+            CREATE TABLE IF NOT EXISTS aliases (
+                doc_key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                content_hash TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                phash BLOB,
+                text TEXT,
+                PRIMARY KEY (content_hash, page)
+            );
+            CREATE TABLE IF NOT EXISTS ocr (
+                page_key TEXT PRIMARY KEY,
+                text TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS matches (
+                content_hash TEXT NOT NULL,
+                reference_key TEXT NOT NULL,
+                threshold REAL NOT NULL,
+                pages TEXT NOT NULL,
+                PRIMARY KEY (content_hash, reference_key, threshold)
+            );
+            """
+        )
+        # Columns added after the first release
+        for column, column_type in (('structure', 'TEXT'),):
+            try:
+                _connection.execute(f"ALTER TABLE pages ADD COLUMN {column} {column_type}")
+            except sqlite3.OperationalError:
+                pass  # Already there
+        config.logger.info(f"🗄️ PDF fingerprint cache: {config.PDF_CACHE_PATH}")
+    return _connection
+
+def document_key(message):
+    """Stable key for a Telegram document (same id when reposted/forwarded)"""
+    document = getattr(message, 'document', None)
+    if not document:
+        return None
+    return f"tg:{document.id}"
+
+def file_content_hash(path):
+    """SHA-256 of a file, read in 1MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def resolve_content_hash(doc_key):
+    """Content hash previously seen for this Telegram document (or None)"""
+    if not doc_key:
+        return None
+    try:
+        with _lock:
+            row = _get_connection().execute(
+                "SELECT content_hash FROM aliases WHERE doc_key = ?", (doc_key,)
+            ).fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        config.logger.warning(f"⚠️ PDF cache lookup failed: {e}")
+        return None
+
+def link_document(doc_key, content_hash):
+    """Remember that a Telegram document has this content"""
+    if not doc_key or not content_hash:
+        return
+    try:
+        with _lock:
+            conn = _get_connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO aliases (doc_key, content_hash) VALUES (?, ?)",
+                (doc_key, content_hash)
+            )
+            conn.commit()
+    except Exception as e:
+        config.logger.warning(f"⚠️ PDF cache link failed: {e}")
+
+def load_page_count(content_hash):
+    """Number of pages recorded for this document (or None)"""
+    try:
+        with _lock:
+            row = _get_connection().execute(
+                "SELECT page_count FROM documents WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        config.logger.warning(f"⚠️ PDF cache lookup failed: {e}")
+        return None
+
+def _load_column(content_hash, column):
+    """All pages of one column, or None unless every page has it"""
+    page_count = load_page_count(content_hash)
+    if not page_count:
+        return None
+
+    with _lock:
+        rows = _get_connection().execute(
+            f"SELECT page, {column} FROM pages "
+            f"WHERE content_hash = ? AND {column} IS NOT NULL ORDER BY page",
+            (content_hash,)
+        ).fetchall()
+
+    if len(rows) != page_count:
+        return None
+    return [value for _, value in rows]
+
+def _store_column(content_hash, column, values):
+    """Upsert one column for pages 1..N, keeping the other columns intact"""
+    with _lock:
+        conn = _get_connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO documents (content_hash, page_count, created) VALUES (?, ?, ?)",
+            (content_hash, len(values), time.time())
+        )
+        conn.executemany(
+            f"INSERT INTO pages (content_hash, page, {column}) VALUES (?, ?, ?) "
+            f"ON CONFLICT (content_hash, page) DO UPDATE SET {column} = excluded.{column}",
+            [(content_hash, page_num, value) for page_num, value in enumerate(values, start=1)]
+        )
+        conn.commit()
+
+def load_page_texts(content_hash):
+    """
+    Cached extracted text for every page
+    Returns: list of strings (index 0 = page 1) or None if not cached
+    """
+    try:
+        return _load_column(content_hash, 'text')
+    except Exception as e:
+        config.logger.warning(f"⚠️ PDF cache text lookup failed: {e}")
+        return None
+
+def store_page_texts(content_hash, texts):
+    """Cache extracted text for every page (index 0 = page 1)"""
+    try:
+        _store_column(content_hash, 'text', [text or "" for text in texts])
+    except Exception as e:
+        config.logger.warning(f"⚠️ PDF cache text store failed: {e}")
+
+def load_page_hashes(content_hash):
+    """
+    Cached packed perceptual hashes for every page
+    Returns: list of bytes (index 0 = page 1) or None if not cached
+    """
+    try:
+        return _load_column(content_hash, 'phash')
+    except Exception as e:
+        config.logger.warning(f"⚠️ PDF cache hash lookup failed: {e}")
+        return None
+
+def store_page_hashes(content_hash, hashes):
+    """Cache packed perceptual hashes for every page (index 0 = page 1)"""
+    try:
+        _store_column(content_hash, 'phash', [bytes(h) for h in hashes])
+    except Exception as e:
+        config.logger.warning(f"⚠️ PDF cache hash store failed: {e}")
+
+def load_page_structures(content_hash):
+    """
+    Cached structural fingerprints (content streams + XObjects) for every page
+    Returns: list of hex digests (index 0 = page 1) or None if not cached
+    """
+    try:
+        return _load_column(content_hash, 'structure')
+    except Exception as e:
+        config.logger.warning(f"⚠️ PDF cache structure lookup failed: {e}")
+        return None
+
+def store_page_structures(content_hash, fingerprints):
+    """Cache structural fingerprints for every page (index 0 = page 1)"""
+    try:
+        _store_column(content_hash, 'structure', list(fingerprints))
+    except Exception as e:
+        config.logger.warning(f"⚠️ PDF cache structure store failed: {e}")
+
+def load_ocr_texts(page_keys):
+    """
+    OCR text of pages seen before (in any document)
+    page_keys: structural page fingerprints
+    Returns: dict page_key -> text for the keys that are cached
+    """
+    page_keys = [k for k in page_keys if k]
+    if not page_keys:
+        return {}
+    try:
+        with _lock:
+            placeholders = ",".join("?" * len(page_keys))
+            rows = _get_connection().execute(
+                f"SELECT page_key, text FROM ocr WHERE page_key IN ({placeholders})",
+                page_keys
+            ).fetchall()
+        return dict(rows)
+    except Exception as e:
+        config.logger.warning(f"⚠️ PDF cache OCR lookup failed: {e}")
+        return {}
+
+def store_ocr_texts(texts):
+    """Cache OCR text per page fingerprint (dict page_key -> text)"""
+    try:
+        with _lock:
+            conn = _get_connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO ocr (page_key, text) VALUES (?, ?)",
+                [(k, v) for k, v in texts.items() if k]
+            )
+            conn.commit()
+    except Exception as e:
+        config.logger.warning(f"⚠️ PDF cache OCR store failed: {e}")
+
+def load_match(content_hash, reference_key, threshold):
+    """Pages previously matched against this reference image (or None)"""
+    try:
+        with _lock:
+            row = _get_connection().execute(
+                "SELECT pages FROM matches "
+                "WHERE content_hash = ? AND reference_key = ? AND threshold = ?",
+                (content_hash, reference_key, float(threshold))
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+    except Exception as e:
+        config.logger.warning(f"⚠️ PDF cache match lookup failed: {e}")
+        return None
+
+def store_match(content_hash, reference_key, threshold, pages):
+    """Remember which pages matched this reference image"""
+    try:
+        with _lock:
+            conn = _get_connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO matches (content_hash, reference_key, threshold, pages) "
+                "VALUES (?, ?, ?, ?)",
+                (content_hash, reference_key, float(threshold), json.dumps(sorted(pages)))
+            )
+            conn.commit()
+    except Exception as e:
+        config.logger.warning(f"⚠️ PDF cache match store failed: {e}")
@@ -1,15 +1,85 @@
 import os
+import re
+import time
+import hashlib
+import asyncio
 import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import (
+    ArrayObject, DictionaryObject, EncodedStreamObject, IndirectObject,
+    NameObject, NullObject, StreamObject
+)
+from PyPDF2.filters import FlateDecode
 from pdf2image import convert_from_path
 from PIL import Image
-import imagehash
 import cv2
 from skimage.metrics import structural_similarity as ssim
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
 import config
+import pdf_cache
+from stream import SpooledUploadBuffer
+import page_blocklist
+from keyword_matcher import get_matcher
 
-async def compare_image_to_pdf_page_v2(uploaded_image_path, pdf_page_image_path, threshold=0.7):
+# --- BATCH PERCEPTUAL HASHING ---
+# Bit counts for every byte value (vectorized popcount lookup)
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+_DCT_MATRICES = {}
+
+def _dct_matrix(size, rows):
+    """
+    DCT-II basis (same scaling as scipy.fftpack.dct) cut to the low-frequency rows
+    Cached per (size, rows) so every batch reuses the same matrix
+    """
+    key = (size, rows)
+    if key not in _DCT_MATRICES:
+        k = np.arange(rows).reshape(-1, 1)
+        n = np.arange(size).reshape(1, -1)
+        _DCT_MATRICES[key] = 2.0 * np.cos(np.pi * k * (2 * n + 1) / (2.0 * size))
+    return _DCT_MATRICES[key]
+
+def batch_phash(images, hash_size=16, highfreq_factor=4):
+    """
+    Compute perceptual hashes for many PIL images in one NumPy pass
+    Same algorithm as imagehash.phash(image, hash_size), but not bit-compatible:
+    on flat images (blank pages) every coefficient sits at the median and
+    float rounding decides the bits, so up to half of them differ. Every
+    hash that gets compared (pages, references, blocklist, photos) comes
+    from this function
+    Returns: uint8 array of shape (N, hash_size*hash_size/8) - packed hash bits
+    """
+    img_size = hash_size * highfreq_factor
+
+    # Stack downscaled grayscale pages into one (N, size, size) tensor
+    stack = np.stack([
+        np.asarray(img.convert('L').resize((img_size, img_size), Image.LANCZOS), dtype=np.float64)
+        for img in images
+    ])
+
+    # Low-frequency 2D DCT for all pages at once: D @ X @ D.T
+    dct = _dct_matrix(img_size, hash_size)
+    lowfreq = dct @ stack @ dct.T
+
+    # Compare each coefficient block against its own median
+    medians = np.median(lowfreq.reshape(len(images), -1), axis=1).reshape(-1, 1, 1)
+    bits = lowfreq > medians
+    return np.packbits(bits.reshape(len(images), -1), axis=1)
+
+def hamming_distances(hashes, reference_hash):
+    """
+    Vectorized Hamming distance between packed hashes and one packed reference
+    Returns: int array of shape (N,)
+    """
+    xor = np.bitwise_xor(hashes, reference_hash)
+    return _POPCOUNT_TABLE[xor].sum(axis=1, dtype=np.int64)
+
+async def compare_image_to_pdf_page_v2(uploaded_image_path, pdf_page_image_path, threshold=0.7, use_phash=True):
     """
     IMPROVED: Multi-method image comparison
     Methods: 
@@ -18,25 +88,39 @@ async def compare_image_to_pdf_page_v2(uploaded_image_path, pdf_page_image_path,
     3. ORB Feature Matching (rotation/scale resistant)
     
     threshold: 0.0-1.0 where 1.0 = identical (SSIM/Feature method)
+    use_phash: False when PHash was already checked (e.g. on the batch page hashes)
+    Runs in the default executor - decoding, SSIM and ORB are CPU work
     Returns: (is_match, similarity_score, method_used)
     """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, _compare_images, uploaded_image_path, pdf_page_image_path, threshold, use_phash
+    )
+
+def _compare_images(uploaded_image_path, pdf_page_image_path, threshold, use_phash):
+    """Body of compare_image_to_pdf_page_v2 (runs in a worker thread)"""
     try:
-        # Load images
-        uploaded_img = Image.open(uploaded_image_path).convert('RGB')
-        pdf_page_img = Image.open(pdf_page_image_path).convert('RGB')
+        # Load images (JPEGs decode at reduced scale - every method works at <=800x600)
+        uploaded_img = Image.open(uploaded_image_path)
+        uploaded_img.draft('RGB', (800, 600))
+        uploaded_img = uploaded_img.convert('RGB')
+        pdf_page_img = Image.open(pdf_page_image_path)
+        pdf_page_img.draft('RGB', (800, 600))
+        pdf_page_img = pdf_page_img.convert('RGB')
         
         # METHOD 1: Enhanced Perceptual Hash
-        try:
-            uploaded_hash = imagehash.phash(uploaded_img, hash_size=16)  # Larger hash
-            pdf_hash = imagehash.phash(pdf_page_img, hash_size=16)
-            hash_diff = uploaded_hash - pdf_hash
-            hash_similarity = 1.0 - (hash_diff / 256.0)  # Normalize to 0-1
-            
-            if hash_similarity >= threshold:
-                config.logger.info(f"✅ PHash Match: {hash_similarity:.3f}")
-                return True, hash_similarity, "phash"
-        except Exception as e:
-            config.logger.warning(f"⚠️ PHash failed: {e}")
+        if use_phash:
+            try:
+                # Same hashes as the batch page/blocklist hashes
+                uploaded_hash, pdf_hash = batch_phash([uploaded_img, pdf_page_img], hash_size=16)
+                hash_diff = int(hamming_distances(pdf_hash[np.newaxis], uploaded_hash)[0])
+                hash_similarity = 1.0 - (hash_diff / 256.0)  # Normalize to 0-1
+                
+                if hash_similarity >= threshold:
+                    config.logger.info(f"✅ PHash Match: {hash_similarity:.3f}")
+                    return True, hash_similarity, "phash"
+            except Exception as e:
+                config.logger.warning(f"⚠️ PHash failed: {e}")
         
         # METHOD 2: SSIM (Best for screenshots)
         try:
@@ -101,116 +185,1088 @@ async def compare_image_to_pdf_page_v2(uploaded_image_path, pdf_page_image_path,
         config.logger.error(f"❌ Image comparison error: {e}")
         return False, 0.0, "error"
 
-async def find_matching_pages_by_image(pdf_path, reference_image_path, threshold=0.7):
+# --- STRUCTURAL PAGE FINGERPRINTS ---
+def _raw_stream_data(obj):
+    """Stored (still encoded) bytes of a stream object - no decoding needed"""
+    data = getattr(obj, '_data', None)
+    if data is None:
+        data = obj.get_data()
+    return data
+
+def _xobject_digests(resources, digests, seen):
+    """Collect digests of every image/form XObject reachable from resources"""
+    if not resources:
+        return
+    resources = resources.get_object()
+    xobjects = resources.get('/XObject')
+    if not xobjects:
+        return
+    
+    for ref in xobjects.get_object().values():
+        key = (ref.idnum, ref.generation) if hasattr(ref, 'idnum') else id(ref)
+        if key in seen:
+            continue
+        seen.add(key)
+        
+        xobject = ref.get_object()
+        digests.append(hashlib.sha256(_raw_stream_data(xobject)).hexdigest())
+        if xobject.get('/Subtype') == '/Form':
+            _xobject_digests(xobject.get('/Resources'), digests, seen)
+
+# Digest blank pages had before they got "" (still in older samples/caches)
+_BLANK_PAGE_DIGEST = hashlib.sha256(b"").hexdigest()
+
+# Content stream operators that put something on the page
+_PAINT_OPERATORS = {
+    b'Do', b'Tj', b'TJ', b"'", b'"', b'BI', b'sh',
+    b'f', b'F', b'f*', b'S', b's', b'B', b'B*', b'b', b'b*',
+}
+_CONTENT_TOKEN = re.compile(rb'[^\s\[\]<>(){}/%]+')
+
+def _paints(data):
+    """True if content stream bytes contain a painting operator"""
+    return not _PAINT_OPERATORS.isdisjoint(_CONTENT_TOKEN.findall(data))
+
+def page_fingerprint(page):
+    """
+    Structural fingerprint of a page: content streams + referenced XObjects
+    Byte-identical injected pages get the same fingerprint in any PDF
+    Blank pages (no painting operators - XObjects only count when drawn)
+    get "" - they would otherwise share one digest with every blank page
+    of every PDF
+    """
+    digest = hashlib.sha256()
+    content_streams = []
+    
+    contents = page.get('/Contents')
+    if contents is not None:
+        contents = contents.get_object()
+        streams = contents if isinstance(contents, list) else [contents]
+        for stream in streams:
+            stream = stream.get_object()
+            content_streams.append(stream)
+            digest.update(_raw_stream_data(stream))
+    
+    # XObject resource names can differ between PDFs - only their data counts
+    xobject_digests = []
+    _xobject_digests(page.get('/Resources'), xobject_digests, set())
+    for xobject_digest in sorted(xobject_digests):
+        digest.update(xobject_digest.encode())
+    
+    if not any(_paints(stream.get_data()) for stream in content_streams):
+        return ""
+    return digest.hexdigest()
+
+def page_fingerprints(reader):
+    """Structural fingerprint of every page (index 0 = page 1)"""
+    fingerprints = []
+    for page in reader.pages:
+        try:
+            fingerprints.append(page_fingerprint(page))
+        except Exception as e:
+            config.logger.debug(f"⚠️ Page fingerprint failed: {e}")
+            fingerprints.append("")
+    return fingerprints
+
+async def learn_sample_fingerprints(sample_path, pages=None):
     """
-    Find all PDF pages matching reference image
-    threshold: 0.7 = 70% similarity (adjustable: 0.6-0.9)
-    Returns: List of matching page numbers (1-indexed)
+    Learn unwanted pages from a sample PDF
+    pages: page numbers to learn (1-indexed), None = all pages
+    Returns: {'structural': [hex], 'phash': [hex]} - phash only if rendering works
     """
+    loop = asyncio.get_running_loop()
+    reader = await loop.run_in_executor(None, PdfReader, sample_path)
+    total_pages = len(reader.pages)
+    selected = [p for p in (pages or range(1, total_pages + 1)) if 0 < p <= total_pages]
+    
+    fingerprints = await loop.run_in_executor(None, page_fingerprints, reader)
+    # Blank (or unreadable) sample pages would match every blank page
+    skipped = [p for p in selected if not fingerprints[p - 1]]
+    selected = [p for p in selected if fingerprints[p - 1]]
+    structural = sorted({fingerprints[p - 1] for p in selected})
+    
+    # Perceptual hashes for the rasterization fallback
+    phashes = []
     try:
-        config.logger.info(f"🔍 Starting image-based page search...")
-        config.logger.info(f"📸 Reference: {reference_image_path}")
-        config.logger.info(f"🎯 Threshold: {threshold} (70% = good match)")
-        
-        # Convert PDF to images with higher DPI for better matching
-        temp_dir = tempfile.gettempdir()
-        config.logger.info(f"📄 Converting PDF to images (this may take time)...")
-        
-        pdf_images = convert_from_path(
-            pdf_path, 
-            dpi=150,  # Good balance of quality/speed
-            output_folder=temp_dir,
-            fmt='jpeg'
-        )
-        
-        config.logger.info(f"✅ Converted {len(pdf_images)} pages to images")
+        with tempfile.TemporaryDirectory() as raster_dir:
+            pdf_images = await loop.run_in_executor(None, _render_pages, sample_path, raster_dir)
+            if pdf_images and selected:
+                hashes = batch_phash([pdf_images[p - 1] for p in selected], hash_size=16)
+                phashes = sorted({bytes(h).hex() for h in hashes})
+    except Exception as e:
+        config.logger.warning(f"⚠️ Sample rendering failed (structural only): {e}")
+    
+    config.logger.info(
+        f"🧬 Learned {len(structural)} page fingerprint(s), {len(phashes)} hash(es) "
+        f"from {len(selected)} sample page(s), {len(skipped)} blank page(s) skipped"
+    )
+    return {'structural': structural, 'phash': phashes}
+
+def _match_sample_phashes(page_hashes, sample_phashes, threshold=None):
+    """Rasterization fallback - pages whose PHash is close to a sample page"""
+    if threshold is None:
+        threshold = config.PAGE_BLOCKLIST_THRESHOLD
+    
+    samples = np.array([list(bytes.fromhex(h)) for h in sample_phashes], dtype=np.uint8)
+    max_distance = (1.0 - threshold) * samples.shape[1] * 8
+    
+    matching_pages = []
+    for page_num, packed_hash in enumerate(page_hashes, start=1):
+        distances = hamming_distances(samples, np.frombuffer(bytes(packed_hash), dtype=np.uint8))
+        if distances.min() <= max_distance:
+            matching_pages.append(page_num)
+    return matching_pages
+
+def _render_pages(pdf_path, output_folder, first_page=None, last_page=None):
+    """Rasterize pages (JPEG files in output_folder, opened lazily)"""
+    return convert_from_path(
+        pdf_path, 
+        dpi=150,  # Good balance of quality/speed
+        output_folder=output_folder,
+        fmt='jpeg',
+        first_page=first_page,
+        last_page=last_page
+    )
+
+# --- EMBEDDED PAGE IMAGES (SCANNED PDFs) ---
+# Filters PIL can decode straight from the stored stream bytes
+_EMBEDDED_IMAGE_FORMATS = {'/DCTDecode': 'jpg', '/JPXDecode': 'jp2'}
+
+def _embedded_page_image(page, page_num, output_folder, draft_size=(800, 600)):
+    """
+    The single full-page image of a scanned page, written as stored (no re-encode)
+    draft_size: JPEGs decode at the smallest scale >= this (rotated pages are
+                saved again at that size) - None = full resolution, rotated
+                in memory only (OCR)
+    Returns: opened PIL image or None
+    """
+    resources = page.get('/Resources')
+    if not resources:
+        return None
+    xobjects = resources.get_object().get('/XObject')
+    if not xobjects:
+        return None
+    xobjects = [ref.get_object() for ref in xobjects.get_object().values()]
+    
+    # Image-only page: exactly one image, no forms, no text drawing
+    if len(xobjects) != 1 or xobjects[0].get('/Subtype') != '/Image':
+        return None
+    contents = page.get_contents()
+    if contents is None or b'BT' in contents.get_data():
+        return None
+    
+    image_obj = xobjects[0]
+    filters = image_obj.get('/Filter')
+    if isinstance(filters, list):
+        if len(filters) != 1:
+            return None
+        filters = filters[0]
+    extension = _EMBEDDED_IMAGE_FORMATS.get(filters)
+    if not extension:
+        return None
+    
+    # The image must cover the page (same aspect ratio, allowing /Rotate)
+    rotation = int(page.get('/Rotate', 0) or 0) % 360
+    page_width, page_height = float(page.mediabox.width), float(page.mediabox.height)
+    image_width, image_height = float(image_obj['/Width']), float(image_obj['/Height'])
+    if abs(image_width / image_height - page_width / page_height) > 0.1 * (page_width / page_height):
+        return None
+    
+    image_path = os.path.join(output_folder, f"embedded_{page_num}.{extension}")
+    with open(image_path, 'wb') as f:
+        f.write(_raw_stream_data(image_obj))
+    
+    image = Image.open(image_path)
+    if draft_size:
+        image.draft('RGB', draft_size)
+    if rotation:
+        # PDF /Rotate is clockwise, PIL rotates counter-clockwise
+        image = image.convert('RGB').rotate(-rotation, expand=True)
+        if draft_size:
+            image.save(image_path, 'JPEG', quality=95)
+            image = Image.open(image_path)
+    return image
+
+def _load_page_images(pdf_path, output_folder, reader, pages=None):
+    """
+    One image per page for matching
+    Scanned pages use their embedded image, everything else is rendered
+    pages: page numbers to load (1-indexed), None = all - the others stay None
+    Returns: (images, embedded_count)
+    """
+    total_pages = len(reader.pages)
+    images = [None] * total_pages
+    wanted = [i for i in range(total_pages) if pages is None or i + 1 in pages]
+    
+    if config.PDF_EMBEDDED_IMAGE_MODE:
+        for index in wanted:
+            try:
+                images[index] = _embedded_page_image(reader.pages[index], index + 1, output_folder)
+            except Exception as e:
+                config.logger.debug(f"⚠️ Embedded image {index + 1} skipped: {e}")
+    embedded_count = sum(1 for image in images if image is not None)
+    
+    if embedded_count == 0 and pages is None:
+        return _render_pages(pdf_path, output_folder), 0
+    
+    # Render only the remaining pages, in contiguous ranges
+    missing = [index for index in wanted if images[index] is None]
+    position = 0
+    while position < len(missing):
+        end = position
+        while end + 1 < len(missing) and missing[end + 1] == missing[end] + 1:
+            end += 1
+        first, last = missing[position], missing[end]
+        rendered = _render_pages(pdf_path, output_folder, first_page=first + 1, last_page=last + 1)
+        images[first:last + 1] = rendered
+        position = end + 1
+    
+    return images, embedded_count
+
+def _reference_phash_scores(page_hashes, reference_image_path):
+    """PHash similarity of every page to the reference (None if unavailable)"""
+    if page_hashes is None or not len(page_hashes):
+        return None
+    try:
+        reference_img = Image.open(reference_image_path).convert('RGB')
+        reference_hash = batch_phash([reference_img], hash_size=16)[0]
+        hashes = np.array([np.frombuffer(bytes(h), dtype=np.uint8) for h in page_hashes])  # Cached = bytes
+        distances = hamming_distances(hashes, reference_hash)
+        return (1.0 - distances / 256.0).tolist()
+    except Exception as e:
+        config.logger.warning(f"⚠️ Batch PHash failed: {e}")
+        return None
+
+async def _match_reference_on_pages(pdf_images, page_hashes, reference_image_path, threshold):
+    """
+    Compare rendered pages with the reference image
+    pdf_images: image per page - pages without one (None / not loaded) are
+                decided by their PHash alone
+    page_hashes: packed PHash per page (None = let compare_image_to_pdf_page_v2 hash)
+    Returns: list of matching page numbers (1-indexed)
+    """
+    matching_pages = []
+    best_matches = []  # Store all matches with scores
+    
+    # METHOD 1 for all pages at once: batched PHash
+    phash_scores = _reference_phash_scores(page_hashes, reference_image_path)
+    page_count = max(len(pdf_images), len(phash_scores or []))
+    
+    temp_dir = tempfile.gettempdir()
+    for page_num in range(1, page_count + 1):
+        if phash_scores is not None and phash_scores[page_num - 1] >= threshold:
+            score = phash_scores[page_num - 1]
+            matching_pages.append(page_num)
+            best_matches.append((page_num, score, "phash"))
+            config.logger.info(f"✅ MATCH on page {page_num} (score: {score:.3f}, method: phash)")
+            continue
         
-        matching_pages = []
-        best_matches = []  # Store all matches with scores
+        pdf_page_image = pdf_images[page_num - 1] if page_num <= len(pdf_images) else None
+        if pdf_page_image is None:
+            continue
         
-        for page_num, pdf_page_image in enumerate(pdf_images, start=1):
-            # Save PDF page as temp image
-            temp_page_path = os.path.join(temp_dir, f"pdf_page_{page_num}.jpg")
+        # Rendered pages already live on disk - only save if they don't
+        page_path = getattr(pdf_page_image, 'filename', None)
+        temp_page_path = None
+        if not page_path:
+            temp_page_path = os.path.join(temp_dir, f"pdf_page_{os.getpid()}_{page_num}.jpg")
             pdf_page_image.save(temp_page_path, 'JPEG', quality=95)
-            
-            # Compare with reference
-            is_match, score, method = await compare_image_to_pdf_page_v2(
-                reference_image_path,
-                temp_page_path,
-                threshold
-            )
-            
-            if is_match:
-                matching_pages.append(page_num)
-                best_matches.append((page_num, score, method))
-                config.logger.info(f"✅ MATCH on page {page_num} (score: {score:.3f}, method: {method})")
-            else:
-                config.logger.debug(f"⏭️ Page {page_num}: No match (score: {score:.3f})")
-            
-            # Cleanup temp page
-            if os.path.exists(temp_page_path):
-                os.remove(temp_page_path)
+            page_path = temp_page_path
         
-        # Summary
-        if matching_pages:
-            config.logger.info(f"🎯 FOUND {len(matching_pages)} matching page(s): {matching_pages}")
-            for page, score, method in best_matches:
-                config.logger.info(f"  📄 Page {page}: {score:.1%} similarity ({method})")
+        # Compare with reference
+        is_match, score, method = await compare_image_to_pdf_page_v2(
+            reference_image_path,
+            page_path,
+            threshold,
+            use_phash=phash_scores is None
+        )
+        
+        if is_match:
+            matching_pages.append(page_num)
+            best_matches.append((page_num, score, method))
+            config.logger.info(f"✅ MATCH on page {page_num} (score: {score:.3f}, method: {method})")
         else:
-            config.logger.warning(f"⚠️ No matching pages found!")
-            config.logger.warning(f"💡 Try:")
-            config.logger.warning(f"   - Lower threshold (current: {threshold})")
-            config.logger.warning(f"   - Better quality screenshot")
-            config.logger.warning(f"   - Screenshot full page without cropping")
+            config.logger.debug(f"⏭️ Page {page_num}: No match (score: {score:.3f})")
         
-        return matching_pages
+        # Cleanup temp page
+        if temp_page_path and os.path.exists(temp_page_path):
+            os.remove(temp_page_path)
+    
+    # Summary
+    if matching_pages:
+        config.logger.info(f"🎯 FOUND {len(matching_pages)} matching page(s): {matching_pages}")
+        for page, score, method in best_matches:
+            config.logger.info(f"  📄 Page {page}: {score:.1%} similarity ({method})")
+    else:
+        config.logger.warning(f"⚠️ No matching pages found!")
+        config.logger.warning(f"💡 Try:")
+        config.logger.warning(f"   - Lower threshold (current: {threshold})")
+        config.logger.warning(f"   - Better quality screenshot")
+        config.logger.warning(f"   - Screenshot full page without cropping")
+    
+    return matching_pages
+
+def _match_blocklist(page_hashes, threshold=None):
+    """Blocklist check for already computed page hashes"""
+    matches = page_blocklist.match_pages(page_hashes, threshold)
+    for page_num, score, label in matches:
+        config.logger.info(f"🧱 Blocklisted page {page_num} ({score:.1%}, {label or 'reference'})")
+    
+    config.logger.info(f"🎯 Blocklist matches: {len(matches)} pages")
+    return [page_num for page_num, _, _ in matches]
+
+# --- OUTPUT SIZE OPTIMIZATION ---
+_CONTENT_NAME = re.compile(rb'/([^\s/\[\]<>(){}%]+)')
+_NAME_ESCAPE = re.compile(rb'#([0-9A-Fa-f]{2})')
+_PRUNABLE_RESOURCES = ('/XObject', '/Font', '/ExtGState', '/Pattern', '/Shading', '/Properties', '/ColorSpace')
+
+# Used without ever being named in a content stream
+_IMPLICIT_RESOURCES = ('/DefaultRGB', '/DefaultGray', '/DefaultCMYK')
+
+def _names_in(data):
+    """Every /Name token in content stream bytes"""
+    return {
+        '/' + _NAME_ESCAPE.sub(lambda m: bytes([int(m.group(1), 16)]), name).decode('latin-1')
+        for name in _CONTENT_NAME.findall(data)
+    }
+
+def _content_names(page):
+    """Every /Name token used by the page's content stream (None if unreadable)"""
+    try:
+        contents = page.get_contents()
+        if contents is None:
+            return set()
+        data = contents.get_data()
+    except Exception:
+        return None
+    return _names_in(data)
+
+def _inheriting_streams(resources, name):
+    """
+    Streams drawn through resource `name` that have no /Resources of their
+    own - forms, patterns and Type 3 glyphs like that use the page's
+    """
+    streams = []
+    for category in ('/XObject', '/Pattern', '/Font'):
+        entries = resources.get(category)
+        value = entries.get_object().get(name) if entries is not None else None
+        if value is None:
+            continue
+        obj = value.get_object()
+        if category == '/Font':
+            char_procs = obj.get('/CharProcs')
+            if obj.get('/Subtype') == '/Type3' and '/Resources' not in obj and char_procs is not None:
+                streams.extend(proc.get_object() for proc in char_procs.get_object().values())
+        elif isinstance(obj, StreamObject) and '/Resources' not in obj:
+            streams.append(obj)
+    return streams
+
+def _used_resource_names(page, resources):
+    """
+    Names the page draws, directly or through inheriting streams
+    Returns: set of names (None if a stream can't be read)
+    """
+    used = _content_names(page)
+    if used is None:
+        return None
+    
+    pending = list(used)
+    while pending:
+        for stream in _inheriting_streams(resources, pending.pop()):
+            try:
+                names = _names_in(stream.get_data())
+            except Exception:
+                return None
+            pending.extend(names - used)
+            used |= names
+    return used | set(_IMPLICIT_RESOURCES)
+
+def _prune_page_resources(page):
+    """
+    Drop resource entries the page never draws
+    Pages often share one resource dict with removed pages - that dict gets
+    replaced by a per-page copy, so nothing used elsewhere is touched
+    Returns: number of entries dropped
+    """
+    resources = page.get('/Resources')
+    if resources is None:
+        return 0
+    resources = resources.get_object()
+    used = _used_resource_names(page, resources)
+    if used is None:
+        return 0
+    
+    pruned = DictionaryObject(resources)
+    dropped = 0
+    for category in _PRUNABLE_RESOURCES:
+        entries = resources.get(category)
+        if entries is None:
+            continue
+        entries = entries.get_object()
+        kept = DictionaryObject({k: v for k, v in entries.items() if k in used})
+        if len(kept) != len(entries):
+            dropped += len(entries) - len(kept)
+            pruned[NameObject(category)] = kept
+    
+    if dropped:
+        page[NameObject('/Resources')] = pruned
+    return dropped
+
+def _children(obj):
+    """Direct values of a dict/array/stream"""
+    if isinstance(obj, DictionaryObject):
+        return obj.values()
+    if isinstance(obj, ArrayObject):
+        return obj
+    return ()
+
+def _reachable_objects(writer):
+    """idnums of writer objects reachable from the catalog and info dicts"""
+    reachable = set()
+    stack = [writer._root, writer._info]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, IndirectObject):
+            if obj.pdf is not writer:
+                # Not swept yet - the writer resolves it to its translated copy
+                translated = writer._id_translated.get(id(obj.pdf), {}).get(obj.idnum)
+                if translated is None:
+                    continue
+                obj = IndirectObject(translated, 0, writer)
+            if obj.idnum in reachable:
+                continue
+            reachable.add(obj.idnum)
+            obj = writer._objects[obj.idnum - 1]
+        stack.extend(_children(obj))
+    return reachable
+
+def _stream_bytes(writer, idnums):
+    """Stored stream bytes of the given objects"""
+    total = 0
+    for idnum in idnums:
+        obj = writer._objects[idnum - 1]
+        if isinstance(obj, StreamObject):
+            total += len(_raw_stream_data(obj) or b"")
+    return total
+
+def _remap_references(writer, remap):
+    """Point every reference at a duplicate to its canonical object"""
+    stack = [obj for obj in writer._objects if obj is not None]
+    seen = set()
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, DictionaryObject):
+            for key, value in list(obj.items()):
+                if isinstance(value, IndirectObject) and value.pdf is writer and value.idnum in remap:
+                    obj[key] = IndirectObject(remap[value.idnum], 0, writer)
+                else:
+                    stack.append(value)
+        elif isinstance(obj, ArrayObject):
+            for index, value in enumerate(obj):
+                if isinstance(value, IndirectObject) and value.pdf is writer and value.idnum in remap:
+                    obj[index] = IndirectObject(remap[value.idnum], 0, writer)
+                else:
+                    stack.append(value)
+
+def _dedup_streams(writer, idnums):
+    """
+    Merge byte-identical streams (same data + same dictionary)
+    Returns: number of duplicates dropped
+    """
+    canonical = {}
+    remap = {}
+    for idnum in sorted(idnums):
+        obj = writer._objects[idnum - 1]
+        if not isinstance(obj, StreamObject):
+            continue
+        header = repr(sorted((k, repr(v)) for k, v in obj.items() if k != '/Length'))
+        key = (hashlib.sha256(_raw_stream_data(obj) or b"").digest(), header)
+        if key in canonical:
+            remap[idnum] = canonical[key]
+        else:
+            canonical[key] = idnum
+    if remap:
+        _remap_references(writer, remap)
+    return len(remap)
+
+def _compress_streams(writer, idnums):
+    """
+    Flate-encode every stream stored without a filter (kept only if smaller)
+    Returns: number of streams recompressed
+    """
+    compressed = 0
+    for idnum in idnums:
+        obj = writer._objects[idnum - 1]
+        if not isinstance(obj, StreamObject) or '/Filter' in obj:
+            continue
+        data = obj.get_data()
+        encoded = FlateDecode.encode(data)
+        if len(encoded) >= len(data):
+            continue
         
+        stream = EncodedStreamObject()
+        stream.update({k: v for k, v in obj.items() if k != '/Length'})
+        stream[NameObject('/Filter')] = NameObject('/FlateDecode')
+        stream._data = encoded
+        writer._objects[idnum - 1] = stream
+        compressed += 1
+    return compressed
+
+def _optimize_writer(writer):
+    """
+    Shrink a writer before it is saved:
+      - drop resources (fonts, images...) that only removed pages used
+      - merge identical streams
+      - flate-encode uncompressed streams
+      - blank out objects nothing references any more
+    Returns: (resources pruned, streams merged, streams recompressed)
+    """
+    pruned = sum(_prune_page_resources(page) for page in writer.pages)
+    reachable = _reachable_objects(writer)
+    merged = _dedup_streams(writer, reachable)
+    reachable = _reachable_objects(writer)
+    compressed = _compress_streams(writer, reachable)
+    
+    # Unreachable objects still get written - null them (keeps the xref numbering)
+    for index, obj in enumerate(writer._objects):
+        if obj is not None and index + 1 not in reachable:
+            writer._objects[index] = NullObject()
+    
+    return pruned, merged, compressed
+
+def _writer_without_pages(reader, pages_to_skip):
+    """PdfWriter with every page except pages_to_skip (0-indexed)"""
+    writer = PdfWriter()
+    for page_num in range(len(reader.pages)):
+        if page_num not in pages_to_skip:
+            writer.add_page(reader.pages[page_num])
+    return writer
+
+def _check_written(data, expected_pages):
+    """Re-read a written PDF: same page count, every content stream decodes"""
+    check = PdfReader(data)
+    if len(check.pages) != expected_pages:
+        raise ValueError(f"{len(check.pages)} pages instead of {expected_pages}")
+    for page in check.pages:
+        if _content_names(page) is None:
+            raise ValueError("unreadable page content")
+    data.seek(0)
+
+def _write_without_pages(reader, pages_to_remove, file_name, optimize=None):
+    """
+    Write every page of an open PdfReader except pages_to_remove (1-indexed)
+    into a SpooledUploadBuffer named file_name
+    optimize: shrink the output too (default PDF_OPTIMIZE_OUTPUT) - the plain
+              write is kept if the optimized one is invalid or not smaller
+    Returns: (buffer at position 0, size, kept_pages) - (None, 0, total) if
+             nothing is removed
+    """
+    if optimize is None:
+        optimize = config.PDF_OPTIMIZE_OUTPUT
+    
+    total_pages = len(reader.pages)
+    pages_to_skip = set(p - 1 for p in pages_to_remove if 0 < p <= total_pages)
+    
+    if not pages_to_skip:
+        return None, 0, total_pages
+    
+    kept_pages = total_pages - len(pages_to_skip)
+    # Written before the optimizer touches anything shared with the reader
+    plain = SpooledUploadBuffer(file_name, max_size=config.PDF_MEMORY_OUTPUT_LIMIT)
+    _writer_without_pages(reader, pages_to_skip).write(plain)
+    plain_size = plain.tell()
+    plain.seek(0)
+    if not optimize:
+        return plain, plain_size, kept_pages
+    
+    optimized = SpooledUploadBuffer(file_name, max_size=config.PDF_MEMORY_OUTPUT_LIMIT)
+    try:
+        writer = _writer_without_pages(reader, pages_to_skip)
+        pruned, merged, compressed = _optimize_writer(writer)
+        writer.write(optimized)
+        optimized_size = optimized.tell()
+        _check_written(optimized, kept_pages)
     except Exception as e:
-        config.logger.error(f"❌ Page matching error: {e}")
-        return []
+        config.logger.warning(f"⚠️ PDF optimization skipped: {e}")
+        optimized.close()
+        return plain, plain_size, kept_pages
+    
+    config.logger.info(
+        f"🗜️ PDF optimized: {pruned} unused resources, {merged} duplicate streams, "
+        f"{compressed} recompressed - {plain_size / 1024:.1f}KB -> {optimized_size / 1024:.1f}KB"
+    )
+    if optimized_size < plain_size:
+        plain.close()
+        return optimized, optimized_size, kept_pages
+    optimized.close()
+    return plain, plain_size, kept_pages
 
-async def remove_pdf_pages(input_path, pages_to_remove):
+async def add_blocklist_reference(image_path, label=None):
     """
-    Remove specific pages from PDF
-    pages_to_remove: list of page numbers (1-indexed)
-    Returns: (output_path, kept_pages, removed_pages)
+    Add a screenshot of an unwanted page to the page blocklist
+    Returns: (added, blocklist_size)
     """
     try:
-        reader = PdfReader(input_path)
-        writer = PdfWriter()
-        
+        image = Image.open(image_path).convert('RGB')
+        packed_hash = batch_phash([image], hash_size=16)[0]
+        return page_blocklist.add_reference(packed_hash, label)
+    except Exception as e:
+        config.logger.error(f"❌ Blocklist add error: {e}")
+        return False, page_blocklist.blocklist_size()
+
+async def process_pdf(input_path, settings, content_hash=None, pages_to_remove=None):
+    """
+    One-pass PDF stage: parse once, run every configured selector over the
+    same parsed pages / rasters, then write the output from that same parse
+    pages_to_remove: already resolved pages (e.g. from the fingerprint cache)
+    Returns: (output_file or None, output_size, removed_pages, timings)
+    output_file: spooled buffer positioned at 0, ready for send_file
+                 (RAM up to PDF_MEMORY_OUTPUT_LIMIT, anonymous temp file above)
+    timings: seconds per step - parse, keywords, render, image, blocklist, write
+    """
+    timings = {}
+    loop = asyncio.get_running_loop()
+    
+    try:
+        started = time.time()
+        reader = await loop.run_in_executor(None, PdfReader, input_path)
         total_pages = len(reader.pages)
+        timings['parse'] = time.time() - started
         config.logger.info(f"📄 PDF Total Pages: {total_pages}")
         
-        # Convert to 0-indexed and validate
-        pages_to_skip = set(p - 1 for p in pages_to_remove if 0 < p <= total_pages)
-        
-        if not pages_to_skip:
-            config.logger.warning(f"⚠️ No valid pages to remove!")
-            return None, total_pages, 0
+        if pages_to_remove is None:
+            pages_to_remove = set(settings.get('pdf_pages_list') or [])
+            
+            # TEXT SELECTOR
+            if settings.get('pdf_keywords'):
+                started = time.time()
+                config.logger.info(f"🔍 Searching for keywords: {settings['pdf_keywords']}")
+                matcher = _keyword_matcher(
+                    settings['pdf_keywords'],
+                    whole_word=settings.get('pdf_keywords_whole_word'),
+                    fold_diacritics=settings.get('pdf_keywords_fold_diacritics'),
+                    fold_case=settings.get('pdf_keywords_fold_case')
+                )
+                keyword_pages = []
+                
+                def match_page(page_num, text):
+                    # Runs as each text shard arrives, not after the whole PDF
+                    keyword = matcher.first_match(text)
+                    if keyword is not None:
+                        keyword_pages.append(page_num)
+                        config.logger.info(f"✅ Found '{keyword}' on page {page_num}")
+                
+                await get_page_texts(input_path, content_hash, reader=reader, on_text=match_page)
+                keyword_pages.sort()
+                config.logger.info(f"🎯 Total keyword matches: {len(keyword_pages)} pages")
+                pages_to_remove.update(keyword_pages)
+                timings['keywords'] = time.time() - started
+            
+            # STRUCTURAL SELECTOR - exact repeats without rendering
+            sample = settings.get('pdf_sample_fingerprints')
+            structural_pages = []
+            if sample:
+                started = time.time()
+                fingerprints = pdf_cache.load_page_structures(content_hash) if content_hash else None
+                if fingerprints is None:
+                    fingerprints = await loop.run_in_executor(None, page_fingerprints, reader)
+                    if content_hash:
+                        pdf_cache.store_page_structures(content_hash, fingerprints)
+                
+                sample_set = set(sample.get('structural', [])) - {_BLANK_PAGE_DIGEST}
+                structural_pages = [
+                    page_num for page_num, fp in enumerate(fingerprints, start=1)
+                    if fp and fp in sample_set
+                ]
+                config.logger.info(f"🧬 Structural matches: {len(structural_pages)} pages {structural_pages}")
+                pages_to_remove.update(structural_pages)
+                timings['structure'] = time.time() - started
+            
+            # Only rasterize for the sample when no exact repeat was found
+            sample_fallback = (
+                sample and not structural_pages and sample.get('phash')
+                and config.PDF_SAMPLE_RASTER_FALLBACK
+            )
+            
+            # IMAGE SELECTORS - share one rasterization and one hash pass
+            reference_path = settings.get('pdf_reference_image')
+            threshold = settings.get('pdf_image_threshold', 0.7)
+            use_blocklist = settings.get('pdf_use_blocklist') and page_blocklist.blocklist_size()
+            
+            reference_key = None
+            cached_match = None
+            if reference_path and content_hash:
+                reference_key = pdf_cache.file_content_hash(reference_path)
+                cached_match = pdf_cache.load_match(content_hash, reference_key, threshold)
+            
+            match_reference = reference_path and cached_match is None
+            page_hashes = None
+            if (use_blocklist or sample_fallback or match_reference) and content_hash:
+                page_hashes = pdf_cache.load_page_hashes(content_hash)
+            
+            # New reference on a known PDF: PHash against the cached page hashes
+            # first, only the close (but not matching) pages need an image
+            image_pages = None  # None = every page
+            if match_reference and page_hashes is not None:
+                scores = _reference_phash_scores(page_hashes, reference_path)
+                if scores is not None:
+                    image_pages = {
+                        page_num for page_num, score in enumerate(scores, start=1)
+                        if config.PDF_IMAGE_CANDIDATE <= score < threshold
+                    }
+            
+            need_render = (
+                (match_reference and (image_pages is None or image_pages)) or
+                ((use_blocklist or sample_fallback) and page_hashes is None)
+            )
+            
+            with tempfile.TemporaryDirectory() as raster_dir:
+                pdf_images = []
+                if need_render:
+                    started = time.time()
+                    config.logger.info(
+                        f"📄 Converting PDF to images (this may take time)..." if image_pages is None
+                        else f"📄 Loading {len(image_pages)} candidate page(s) {sorted(image_pages)}"
+                    )
+                    pdf_images, embedded_count = await loop.run_in_executor(
+                        None, _load_page_images, input_path, raster_dir, reader, image_pages
+                    )
+                    if embedded_count:
+                        config.logger.info(
+                            f"🖼️ Used embedded images for {embedded_count}/{total_pages} pages (no rendering)"
+                        )
+                    if image_pages is None:
+                        try:
+                            page_hashes = batch_phash(pdf_images, hash_size=16) if pdf_images else None
+                            if content_hash and page_hashes is not None:
+                                pdf_cache.store_page_hashes(content_hash, page_hashes)
+                        except Exception as e:
+                            config.logger.warning(f"⚠️ Batch PHash failed: {e}")
+                    timings['render'] = time.time() - started
+                
+                if reference_path:
+                    started = time.time()
+                    if cached_match is not None:
+                        config.logger.info(f"🗄️ Cached image match: {cached_match}")
+                        image_pages = cached_match
+                    else:
+                        image_pages = await _match_reference_on_pages(
+                            pdf_images, page_hashes, reference_path, threshold
+                        )
+                        if content_hash:
+                            pdf_cache.store_match(content_hash, reference_key, threshold, image_pages)
+                    pages_to_remove.update(image_pages)
+                    timings['image'] = time.time() - started
+                
+                if use_blocklist:
+                    started = time.time()
+                    pages_to_remove.update(_match_blocklist(page_hashes if page_hashes is not None else []))
+                    timings['blocklist'] = time.time() - started
+                
+                if sample_fallback and page_hashes is not None:
+                    started = time.time()
+                    fallback_pages = _match_sample_phashes(page_hashes, sample['phash'])
+                    config.logger.info(f"🧬 Raster fallback matches: {len(fallback_pages)} pages {fallback_pages}")
+                    pages_to_remove.update(fallback_pages)
+                    timings['structure_fallback'] = time.time() - started
         
-        kept_pages = 0
-        for page_num in range(total_pages):
-            if page_num not in pages_to_skip:
-                writer.add_page(reader.pages[page_num])
-                kept_pages += 1
+        removed = sorted(p for p in pages_to_remove if 0 < p <= total_pages)
+        output_file = None
+        output_size = 0
         
-        # Create output file
-        temp_dir = tempfile.gettempdir()
-        output_path = os.path.join(temp_dir, f"modified_{os.path.basename(input_path)}")
+        if removed:
+            started = time.time()
+            output_file, output_size, kept_pages = await loop.run_in_executor(
+                None, _write_without_pages, reader, removed,
+                f"modified_{os.path.basename(input_path)}"
+            )
+            timings['write'] = time.time() - started
+            
+            config.logger.info(f"✅ PDF Modified Successfully!")
+            config.logger.info(f"   📊 Kept: {kept_pages} pages")
+            config.logger.info(f"   🗑️ Removed: {len(removed)} pages {removed}")
         
-        with open(output_path, 'wb') as output_file:
-            writer.write(output_file)
+        config.logger.info(
+            "⏱️ PDF stage: " + " | ".join(f"{step} {seconds:.2f}s" for step, seconds in timings.items())
+        )
+        return output_file, output_size, removed, timings
         
-        config.logger.info(f"✅ PDF Modified Successfully!")
-        config.logger.info(f"   📊 Kept: {kept_pages} pages")
-        config.logger.info(f"   🗑️ Removed: {len(pages_to_skip)} pages {sorted(pages_to_remove)}")
+    except Exception as e:
+        config.logger.error(f"❌ PDF Processing Error: {e}")
+        return None, 0, [], timings
+
+# --- PARALLEL TEXT EXTRACTION ---
+_process_pool = None
+
+def _get_process_pool():
+    """Shared worker processes for CPU-heavy PDF work (created on first use)"""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=config.PDF_PROCESS_WORKERS)
+        config.logger.info(f"⚙️ PDF process pool: {config.PDF_PROCESS_WORKERS} workers")
+    return _process_pool
+
+def shutdown_process_pool():
+    """Stop PDF worker processes (called on bot shutdown)"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+def _count_pages(input_path):
+    """Page count (runs in a worker)"""
+    return len(PdfReader(input_path).pages)
+
+def _extract_text_range(input_path, start, end):
+    """
+    Extract text of pages [start, end) - runs in a worker process
+    Returns: list of (page_num, text) with 1-indexed page numbers
+    """
+    reader = PdfReader(input_path)
+    results = []
+    for index in range(start, min(end, len(reader.pages))):
+        try:
+            text = reader.pages[index].extract_text() or ""
+        except Exception:
+            text = ""
+        results.append((index + 1, text))
+    return results
+
+async def iter_page_texts(input_path):
+    """
+    Stream (page_num, text) as page-range shards finish in the process pool
+    Pages arrive in completion order, not page order
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_process_pool()
+    
+    total_pages = await loop.run_in_executor(pool, _count_pages, input_path)
+    shard = max(1, config.PDF_TEXT_SHARD_PAGES)
+    
+    futures = [
+        loop.run_in_executor(pool, _extract_text_range, input_path, start, start + shard)
+        for start in range(0, total_pages, shard)
+    ]
+    
+    try:
+        for future in asyncio.as_completed(futures):
+            for page_num, text in await future:
+                yield page_num, text
+    finally:
+        for future in futures:
+            future.cancel()
+
+async def extract_page_texts_parallel(input_path, on_text=None):
+    """
+    Text of every page, extracted by the process pool
+    on_text: called with (page_num, text) as each shard finishes
+    Returns: list of strings (index 0 = page 1)
+    """
+    page_texts = {}
+    async for page_num, text in iter_page_texts(input_path):
+        page_texts[page_num] = text
+        if on_text:
+            on_text(page_num, text)
+    return [page_texts[page_num] for page_num in sorted(page_texts)]
+
+# --- OCR FOR IMAGE-ONLY PAGES ---
+_ocr_available = None
+
+def is_ocr_available():
+    """Check once if pytesseract + the tesseract binary are installed"""
+    global _ocr_available
+    if _ocr_available is None:
+        try:
+            pytesseract.get_tesseract_version()
+            _ocr_available = True
+        except Exception:
+            _ocr_available = False
+            config.logger.warning("⚠️ OCR unavailable (install tesseract-ocr + pytesseract)")
+    return _ocr_available
+
+def _ocr_page(input_path, page_num):
+    """
+    OCR one page - runs in a worker process
+    Uses the embedded scan when possible, renders the page otherwise
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        page = PdfReader(input_path).pages[page_num - 1]
+        image = None
+        try:
+            image = _embedded_page_image(page, page_num, work_dir, draft_size=None)
+        except Exception:
+            image = None
         
-        return output_path, kept_pages, len(pages_to_skip)
+        if image is None:
+            image = convert_from_path(
+                input_path,
+                dpi=config.PDF_OCR_DPI,
+                first_page=page_num,
+                last_page=page_num,
+                output_folder=work_dir,
+                fmt='jpeg'
+            )[0]
         
-    except Exception as e:
-        config.logger.error(f"❌ PDF Manipulation Error: {e}")
-        return None, 0, 0
+        return pytesseract.image_to_string(image, lang=config.PDF_OCR_LANG) or ""
+
+def _ocr_key(fingerprint):
+    """OCR cache key: structural page fingerprint + tesseract language(s)"""
+    return f"{fingerprint}:{config.PDF_OCR_LANG}" if fingerprint else None
+
+def _ocr_enabled():
+    return config.PDF_OCR_ENABLED and pytesseract is not None and is_ocr_available()
+
+async def ocr_empty_pages(input_path, page_texts, reader=None):
+    """
+    Fill pages without a text layer with OCR text
+    Each unique page (structural fingerprint + language) is OCR'd once, ever -
+    failed pages are not cached and get another try next time
+    Returns: (page_texts with OCR text filled in, True if every empty page went through OCR)
+    """
+    empty_pages = [i + 1 for i, text in enumerate(page_texts) if not text.strip()]
+    if not empty_pages:
+        return page_texts, True
+    if not _ocr_enabled():
+        return page_texts, False
+    
+    loop = asyncio.get_running_loop()
+    if reader is None:
+        reader = await loop.run_in_executor(None, PdfReader, input_path)
+    
+    page_keys = {}
+    for page_num in empty_pages:
+        try:
+            fingerprint = page_fingerprint(reader.pages[page_num - 1])
+        except Exception:
+            fingerprint = None
+        if fingerprint == "":
+            continue  # Blank page - nothing to OCR
+        page_keys[page_num] = _ocr_key(fingerprint)
+    
+    empty_pages = list(page_keys)
+    if not empty_pages:
+        return page_texts, True
+    cached = pdf_cache.load_ocr_texts(list(page_keys.values()))
+    todo = [p for p in empty_pages if page_keys[p] not in cached]
+    config.logger.info(
+        f"🔤 OCR: {len(empty_pages)} image-only pages, {len(empty_pages) - len(todo)} cached"
+    )
+    
+    page_texts = list(page_texts)
+    for page_num in empty_pages:
+        if page_keys[page_num] in cached:
+            page_texts[page_num - 1] = cached[page_keys[page_num]]
+    
+    complete = True
+    if todo:
+        pool = _get_process_pool()
+        results = await asyncio.gather(
+            *[loop.run_in_executor(pool, _ocr_page, input_path, p) for p in todo],
+            return_exceptions=True
+        )
+        new_texts = {}
+        for page_num, result in zip(todo, results):
+            if isinstance(result, Exception):
+                config.logger.warning(f"⚠️ OCR failed on page {page_num}: {result}")
+                complete = False
+                continue
+            page_texts[page_num - 1] = result
+            new_texts[page_keys[page_num]] = result
+        pdf_cache.store_ocr_texts(new_texts)
+    
+    return page_texts, complete
+
+def _cached_ocr_texts(content_hash, page_texts):
+    """
+    Image-only pages filled from the OCR cache without opening the PDF
+    Returns: page texts, or None if some page still needs OCR
+    """
+    empty_pages = [i for i, text in enumerate(page_texts) if not text.strip()]
+    if not empty_pages or not _ocr_enabled():
+        return page_texts
+    
+    fingerprints = pdf_cache.load_page_structures(content_hash)
+    if fingerprints is None:
+        return None
+    # "" = known blank page, its empty text is final
+    page_keys = {i: _ocr_key(fingerprints[i]) for i in empty_pages if fingerprints[i] != ""}
+    cached = pdf_cache.load_ocr_texts(list(page_keys.values()))
+    if any(key not in cached for key in page_keys.values()):
+        return None
+    
+    page_texts = list(page_texts)
+    for i, key in page_keys.items():
+        page_texts[i] = cached[key]
+    return page_texts
+
+# --- PAGE TEXT CACHE ---
+# In-process LRU of extracted page text (the fingerprint cache persists it)
+_TEXT_CACHE_SIZE = 16
+_text_cache = OrderedDict()
+
+def _text_cache_key(input_path, content_hash=None):
+    """Content hash when known, else file identity (path + size + mtime)"""
+    if content_hash:
+        return content_hash
+    stat = os.stat(input_path)
+    return (os.path.abspath(input_path), stat.st_size, stat.st_mtime_ns)
+
+async def get_page_texts(input_path, content_hash=None, reader=None, on_text=None):
+    """
+    Text of every page, extracted at most once per PDF
+    Checks memory, then the fingerprint cache, then parses the file in parallel
+    Pages without a text layer are OCR'd (when enabled) - the fingerprint cache
+    keeps the text layer only, OCR text has its own per-page cache
+    reader: already open PdfReader - small PDFs are extracted from it directly
+    on_text: called once per page with (page_num, final text) - pages with a
+             text layer as soon as their shard finishes, the rest after OCR
+    Returns: list of strings (index 0 = page 1)
+    """
+    notified = set()
+    
+    def notify_rest(page_texts):
+        if on_text:
+            for page_num, text in enumerate(page_texts, start=1):
+                if page_num not in notified:
+                    on_text(page_num, text)
+    
+    def notify_streamed(page_num, text):
+        if on_text and text.strip():
+            notified.add(page_num)
+            on_text(page_num, text)
+    
+    key = _text_cache_key(input_path, content_hash)
+    if key in _text_cache:
+        _text_cache.move_to_end(key)
+        notify_rest(_text_cache[key])
+        return _text_cache[key]
+    
+    page_texts = pdf_cache.load_page_texts(content_hash) if content_hash else None
+    
+    if page_texts is None:
+        if reader is not None and len(reader.pages) <= config.PDF_TEXT_SHARD_PAGES:
+            # One shard's worth - not worth re-parsing in a worker
+            loop = asyncio.get_running_loop()
+            page_texts = await loop.run_in_executor(
+                None, lambda: [page.extract_text() or "" for page in reader.pages]
+            )
+        else:
+            page_texts = await extract_page_texts_parallel(input_path, on_text=notify_streamed)
+        if content_hash:
+            pdf_cache.store_page_texts(content_hash, page_texts)
+    else:
+        config.logger.info(f"🗄️ Using cached text for {len(page_texts)} pages")
+    
+    page_texts, complete = await ocr_empty_pages(input_path, page_texts, reader)
+    notify_rest(page_texts)
+    if complete:
+        _text_cache[key] = page_texts
+        if len(_text_cache) > _TEXT_CACHE_SIZE:
+            _text_cache.popitem(last=False)
+    return page_texts
 
 async def extract_pdf_text_from_page(input_path, page_number):
     """
@@ -218,46 +1274,114 @@ async def extract_pdf_text_from_page(input_path, page_number):
     page_number: 1-indexed
     """
     try:
-        reader = PdfReader(input_path)
-        if page_number < 1 or page_number > len(reader.pages):
+        key = _text_cache_key(input_path)
+        if key in _text_cache:
+            page_texts = _text_cache[key]
+            if page_number < 1 or page_number > len(page_texts):
+                return None
+            return page_texts[page_number - 1].strip()
+        
+        if page_number < 1:
             return None
         
-        page = reader.pages[page_number - 1]
-        text = page.extract_text()
-        return text.strip()
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            _get_process_pool(), _extract_text_range,
+            input_path, page_number - 1, page_number
+        )
+        if not results:
+            return None
+        
+        return results[0][1].strip()
         
     except Exception as e:
         config.logger.error(f"❌ Text Extraction Error: {e}")
         return None
 
-async def find_pages_with_keywords(input_path, keywords):
+def _keyword_matcher(keywords, whole_word=None, fold_diacritics=None, fold_case=None):
+    """Compiled matcher for a keyword list (None options = config default)"""
+    if whole_word is None:
+        whole_word = config.PDF_KEYWORD_WHOLE_WORD
+    if fold_diacritics is None:
+        fold_diacritics = config.PDF_KEYWORD_FOLD_DIACRITICS
+    if fold_case is None:
+        fold_case = config.PDF_KEYWORD_FOLD_CASE
+    return get_matcher(keywords, fold_case=fold_case, fold_diacritics=fold_diacritics, whole_word=whole_word)
+
+def match_keywords_in_texts(page_texts, keywords, whole_word=None, fold_diacritics=None, fold_case=None):
     """
-    Find pages containing keywords
-    keywords: list of strings
+    Find pages whose text contains any keyword
+    Single Aho-Corasick pass per page, automaton compiled once per keyword list
+    page_texts: list of page texts (index 0 = page 1)
+    whole_word / fold_diacritics / fold_case: None = config default
     Returns: list of page numbers (1-indexed)
     """
-    try:
-        reader = PdfReader(input_path)
-        matching_pages = []
-        
-        config.logger.info(f"🔍 Searching for keywords: {keywords}")
-        
-        for page_num in range(len(reader.pages)):
-            page = reader.pages[page_num]
-            text = page.extract_text().lower()
-            
-            for keyword in keywords:
-                if keyword.lower() in text:
-                    matching_pages.append(page_num + 1)
-                    config.logger.info(f"✅ Found '{keyword}' on page {page_num + 1}")
-                    break
-        
-        config.logger.info(f"🎯 Total keyword matches: {len(matching_pages)} pages")
-        return matching_pages
-        
-    except Exception as e:
-        config.logger.error(f"❌ Keyword Search Error: {e}")
-        return []
+    matcher = _keyword_matcher(keywords, whole_word, fold_diacritics, fold_case)
+    matching_pages = []
+    
+    for page_num, page_text in enumerate(page_texts, start=1):
+        keyword = matcher.first_match(page_text)
+        if keyword is not None:
+            matching_pages.append(page_num)
+            config.logger.info(f"✅ Found '{keyword}' on page {page_num}")
+    
+    return matching_pages
+
+def cached_pages_to_remove(content_hash, settings):
+    """
+    Resolve all PDF removal settings from the fingerprint cache only
+    Returns: set of page numbers, or None if any selector needs the file
+    """
+    pages_to_remove = set(settings.get('pdf_pages_list') or [])
+    
+    if settings.get('pdf_keywords'):
+        page_texts = pdf_cache.load_page_texts(content_hash)
+        if page_texts is not None:
+            page_texts = _cached_ocr_texts(content_hash, page_texts)
+        if page_texts is None:
+            return None
+        pages_to_remove.update(match_keywords_in_texts(
+            page_texts, settings['pdf_keywords'],
+            whole_word=settings.get('pdf_keywords_whole_word'),
+            fold_diacritics=settings.get('pdf_keywords_fold_diacritics'),
+            fold_case=settings.get('pdf_keywords_fold_case')
+        ))
+    
+    if settings.get('pdf_reference_image'):
+        reference_key = pdf_cache.file_content_hash(settings['pdf_reference_image'])
+        threshold = settings.get('pdf_image_threshold', 0.7)
+        matched_pages = pdf_cache.load_match(content_hash, reference_key, threshold)
+        if matched_pages is None:
+            return None
+        pages_to_remove.update(matched_pages)
+    
+    sample = settings.get('pdf_sample_fingerprints')
+    if sample:
+        fingerprints = pdf_cache.load_page_structures(content_hash)
+        if fingerprints is None:
+            return None
+        sample_set = set(sample.get('structural', [])) - {_BLANK_PAGE_DIGEST}
+        structural_pages = [p for p, fp in enumerate(fingerprints, start=1) if fp and fp in sample_set]
+        if not structural_pages and sample.get('phash') and config.PDF_SAMPLE_RASTER_FALLBACK:
+            page_hashes = pdf_cache.load_page_hashes(content_hash)
+            if page_hashes is None:
+                return None
+            structural_pages = _match_sample_phashes(page_hashes, sample['phash'])
+        pages_to_remove.update(structural_pages)
+    
+    if settings.get('pdf_use_blocklist') and page_blocklist.blocklist_size():
+        page_hashes = pdf_cache.load_page_hashes(content_hash)
+        if page_hashes is None:
+            return None
+        matches = page_blocklist.match_pages(page_hashes)
+        pages_to_remove.update(page_num for page_num, _, _ in matches)
+    
+    # Page numbers beyond the document are ignored by _write_without_pages anyway
+    page_count = pdf_cache.load_page_count(content_hash)
+    if page_count:
+        pages_to_remove = {p for p in pages_to_remove if 0 < p <= page_count}
+    
+    return pages_to_remove
 
 def parse_page_range(page_string):
     """
@@ -0,0 +1,135 @@
+import io
+import os
+import asyncio
+from PIL import Image
+from telethon import utils
+from telethon.tl.types import (
+    PhotoSize, PhotoSizeProgressive, PhotoCachedSize, PhotoStrippedSize
+)
+import config
+import metrics
+import page_blocklist
+from pdf_handler import batch_phash, hamming_distances, compare_image_to_pdf_page_v2
+
+# Reference screenshot hashes, computed once per file version
+# (ref_image_<session>.jpg is overwritten when a new screenshot is sent)
+_reference_hashes = {}
+
+def is_photo_message(message):
+    """Photo or image document"""
+    if getattr(message, 'photo', None):
+        return True
+    return bool(message.file and "image" in (message.file.mime_type or ""))
+
+def _thumb_sizes(message):
+    """Telegram's preview sizes for this photo/image document"""
+    if getattr(message, 'photo', None):
+        return message.photo.sizes or []
+    document = getattr(message, 'document', None)
+    return (document.thumbs or []) if document else []
+
+def _pick_thumb(sizes):
+    """
+    Smallest preview that still hashes like the full image (PHash works on
+    64x64 anyway), inline stripped preview as the last resort
+    Returns: (size type for download_media or None, inline JPEG bytes or None)
+    """
+    usable = [
+        size for size in sizes
+        if isinstance(size, (PhotoSize, PhotoSizeProgressive, PhotoCachedSize))
+        and max(size.w, size.h) >= config.PHOTO_FILTER_THUMB_MIN_SIDE
+    ]
+    if usable:
+        smallest = min(usable, key=lambda size: size.w * size.h)
+        if isinstance(smallest, PhotoCachedSize):
+            return None, smallest.bytes
+        return smallest.type, None
+
+    for size in sizes:
+        if isinstance(size, PhotoStrippedSize):
+            return None, utils.stripped_photo_to_jpg(size.bytes)
+    return None, None
+
+def _reference_hash(reference_path):
+    """Packed 256-bit PHash of the reference screenshot"""
+    stat = os.stat(reference_path)
+    key = (os.path.abspath(reference_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _reference_hashes:
+        for old_key in [k for k in _reference_hashes if k[0] == key[0]]:
+            del _reference_hashes[old_key]  # Replaced screenshot
+        image = Image.open(reference_path).convert('RGB')
+        _reference_hashes[key] = batch_phash([image], hash_size=16)[0]
+    return _reference_hashes[key]
+
+def _phash_checks(data, reference_path, use_blocklist):
+    """
+    PHash of a preview vs the reference screenshot and the page blocklist
+    Returns: (reference similarity or None, blocklist label or None)
+    """
+    image = Image.open(io.BytesIO(data))
+    image.draft('RGB', (256, 256))
+    packed_hash = batch_phash([image.convert('RGB')], hash_size=16)
+
+    similarity = None
+    if reference_path:
+        distance = hamming_distances(packed_hash, _reference_hash(reference_path))[0]
+        similarity = 1.0 - distance / 256.0
+
+    blocked = None
+    if use_blocklist:
+        matches = page_blocklist.match_pages(list(packed_hash))
+        if matches:
+            blocked = matches[0][2] or "blocklist"
+    return similarity, blocked
+
+async def match_photo(client, message, settings):
+    """
+    Photo matches the reference screenshot or the page blocklist?
+    1. PHash on a small Telegram preview (inline, or a few KB download)
+    2. Only when that is close but not conclusive: full image through
+       SSIM/ORB (compare_image_to_pdf_page_v2)
+    Returns: (reason string if the photo should be skipped else None,
+              full image bytes if they had to be downloaded - reuse them for the send)
+    """
+    reference_path = settings.get('pdf_reference_image')
+    threshold = settings.get('pdf_image_threshold', 0.7)
+    use_blocklist = settings.get('pdf_use_blocklist') and page_blocklist.blocklist_size()
+    if not reference_path and not use_blocklist:
+        return None, None
+
+    loop = asyncio.get_running_loop()
+    thumb_type, preview = _pick_thumb(_thumb_sizes(message))
+    if thumb_type:
+        preview = await client.download_media(message, file=bytes, thumb=thumb_type)
+        metrics.BYTES_DOWNLOADED.inc(len(preview or b""), source='photo_preview')
+
+    similarity = None
+    if preview:
+        try:
+            similarity, blocked = await loop.run_in_executor(
+                None, _phash_checks, preview, reference_path, use_blocklist
+            )
+        except Exception as e:
+            config.logger.warning(f"⚠️ Photo preview check failed: {e}")
+        else:
+            if blocked:
+                return f"blocklist ({blocked})", None
+            if similarity is not None and similarity >= threshold:
+                return f"phash {similarity:.1%} (preview)", None
+
+    if not reference_path:
+        return None, None
+    if similarity is not None and similarity < config.PHOTO_FILTER_CANDIDATE:
+        return None, None  # Clearly different - full image never fetched
+
+    full_image = await client.download_media(message, file=bytes)
+    if not full_image:
+        return None, None
+    metrics.BYTES_DOWNLOADED.inc(len(full_image), source='photo_full')
+    is_match, score, method = await compare_image_to_pdf_page_v2(
+        reference_path, io.BytesIO(full_image), threshold,
+        use_phash=similarity is None
+    )
+    if is_match:
+        return f"{method} {score:.1%}", None
+    return None, full_image
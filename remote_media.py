@@ -0,0 +1,193 @@
+import uuid
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from aiohttp import web
+import config
+import metrics
+from utils import human_readable_size
+
+class RemoteMediaFile:
+    """
+    Seekable view of a Telegram document - only the blocks that are
+    actually read get downloaded (iter_download with offsets)
+    """
+    def __init__(self, client, location, file_size, name):
+        self.client = client
+        self.location = location
+        self.file_size = file_size
+        self.name = name
+        self.block_size = config.THUMBNAIL_RANGE_BLOCK
+        self.bytes_fetched = 0
+
+        self._blocks = OrderedDict()  # block index -> bytes (small LRU)
+        self._pending = {}  # block index -> future (same block requested twice)
+
+    async def _fetch_block(self, index):
+        """Download one aligned block"""
+        data = b""
+        async for chunk in self.client.iter_download(
+            self.location,
+            offset=index * self.block_size,
+            limit=1,
+            chunk_size=self.block_size,
+            request_size=self.block_size,
+            file_size=self.file_size
+        ):
+            data = bytes(chunk)
+        self.bytes_fetched += len(data)
+        metrics.BYTES_DOWNLOADED.inc(len(data), source='range')
+        return data
+
+    async def get_block(self, index):
+        """Cached block (fetched at most once while it stays in the LRU)"""
+        if index in self._blocks:
+            self._blocks.move_to_end(index)
+            return self._blocks[index]
+
+        if index in self._pending:
+            return await asyncio.shield(self._pending[index])
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[index] = future
+        try:
+            data = await self._fetch_block(index)
+            future.set_result(data)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody else waits
+            raise
+        finally:
+            del self._pending[index]
+
+        self._blocks[index] = data
+        while len(self._blocks) > config.THUMBNAIL_RANGE_CACHE_BLOCKS:
+            self._blocks.popitem(last=False)
+        return data
+
+    async def iter_range(self, start, end):
+        """Yield the bytes start..end (inclusive) block by block"""
+        position = start
+        while position <= end:
+            index = position // self.block_size
+            block = await self.get_block(index)
+            if not block:
+                return
+            block_start = index * self.block_size
+            piece = block[position - block_start:end - block_start + 1]
+            if not piece:
+                return
+            yield piece
+            position += len(piece)
+
+# --- LOCAL RANGE SERVER ---
+# ffmpeg reads http:// inputs with Range requests, so it can seek to the
+# container index and the target keyframe without the whole file
+_files = {}
+_runner = None
+_base_url = None
+_start_lock = None
+
+def _parse_range(header, file_size):
+    """(start, end) inclusive from a 'bytes=a-b' header (None if absent/invalid)"""
+    if not header or not header.startswith('bytes='):
+        return None
+    first_range = header[6:].split(',')[0].strip()
+    start_text, _, end_text = first_range.partition('-')
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+        else:
+            start = max(0, file_size - int(end_text))  # Suffix range: last N bytes
+            end = file_size - 1
+    except ValueError:
+        return None
+    return start, min(end, file_size - 1)
+
+async def _handle_media(request):
+    media = _files.get(request.match_info['token'])
+    if media is None:
+        raise web.HTTPNotFound()
+
+    byte_range = _parse_range(request.headers.get('Range'), media.file_size)
+    headers = {'Accept-Ranges': 'bytes', 'Content-Type': 'application/octet-stream'}
+
+    if byte_range is None:
+        status, start, end = 200, 0, media.file_size - 1
+    else:
+        start, end = byte_range
+        if start >= media.file_size or start > end:
+            raise web.HTTPRequestRangeNotSatisfiable(
+                headers={'Content-Range': f"bytes */{media.file_size}"}
+            )
+        status = 206
+        headers['Content-Range'] = f"bytes {start}-{end}/{media.file_size}"
+    headers['Content-Length'] = str(end - start + 1)
+
+    response = web.StreamResponse(status=status, headers=headers)
+    await response.prepare(request)
+    if request.method == 'HEAD':
+        return response
+
+    try:
+        async for piece in media.iter_range(start, end):
+            await response.write(piece)
+    except (ConnectionError, asyncio.CancelledError):
+        # ffmpeg closes the connection as soon as it seeks elsewhere
+        return response
+    await response.write_eof()
+    return response
+
+async def _ensure_server():
+    """Start the loopback-only range server on first use"""
+    global _runner, _base_url, _start_lock
+    if _start_lock is None:
+        _start_lock = asyncio.Lock()
+    async with _start_lock:
+        if _runner is not None:
+            return _base_url
+
+        app = web.Application()
+        app.router.add_route('GET', '/media/{token}', _handle_media)
+        app.router.add_route('HEAD', '/media/{token}', _handle_media)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+
+        port = runner.addresses[0][1]
+        _runner = runner
+        _base_url = f"http://127.0.0.1:{port}/media"
+        config.logger.info(f"📡 Range server for thumbnails on 127.0.0.1:{port}")
+        return _base_url
+
+async def stop_server():
+    """Stop the range server (shutdown)"""
+    global _runner, _base_url
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
+        _base_url = None
+
+@asynccontextmanager
+async def remote_media_url(client, location, file_size, name):
+    """
+    Loopback URL ffmpeg can open and seek in, backed by ranged downloads
+    Usage: async with remote_media_url(...) as url: ffmpeg -i url
+    """
+    base_url = await _ensure_server()
+    token = uuid.uuid4().hex
+    media = RemoteMediaFile(client, location, file_size, name)
+    _files[token] = media
+    try:
+        yield f"{base_url}/{token}"
+    finally:
+        _files.pop(token, None)
+        config.logger.info(
+            f"📡 Range-fetched {human_readable_size(media.bytes_fetched)} "
+            f"of {human_readable_size(file_size)} for {name[:40]}"
+        )
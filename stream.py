@@ -1,7 +1,9 @@
 import asyncio
 import time
 import math
+import tempfile
 import config
+import metrics
 from utils import human_readable_size, time_formatter
 
 async def progress_callback(current, total, start_time, file_name, status_msg):
@@ -53,6 +55,7 @@ class SafeBufferedStream:
         self.downloader_task = asyncio.create_task(self._worker())
         self.buffer = b""
         self.closed = False
+        self.wait_seconds = 0.0  # Time read() spent waiting for the downloader
         
         config.logger.info(f"🔒 SAFE Stream: 512KB chunks, 1MB buffer for {file_name}")
 
@@ -68,6 +71,8 @@ class SafeBufferedStream:
                     break
                 
                 await self.queue.put(chunk)
+                metrics.BYTES_DOWNLOADED.inc(len(chunk), source='stream')
+                metrics.STREAM_QUEUE_DEPTH.set(self.queue.qsize())
                 
                 # 🔒 Small delay every 10 chunks to prevent rate limiting
                 self.current_bytes += len(chunk)
@@ -92,7 +97,10 @@ class SafeBufferedStream:
             size = self.chunk_size
             
         while len(self.buffer) < size:
+            waiting_since = time.perf_counter()
             chunk = await self.queue.get()
+            self.wait_seconds += time.perf_counter() - waiting_since
+            metrics.STREAM_QUEUE_DEPTH.set(self.queue.qsize())
             if chunk is None: 
                 if self.current_bytes < self.file_size:
                     config.logger.warning(f"⚠️ Incomplete: {self.current_bytes}/{self.file_size}")
@@ -122,3 +130,17 @@ class SafeBufferedStream:
                 await self.downloader_task
             except asyncio.CancelledError:
                 pass
+
+class SpooledUploadBuffer(tempfile.SpooledTemporaryFile):
+    """
+    Generated upload (rewritten PDF, remuxed video) kept in RAM up to
+    max_size, anonymous temp file above
+    Carries a real file name for the uploader (no path, so no name collisions)
+    """
+    def __init__(self, file_name, max_size):
+        super().__init__(max_size=max_size)
+        self._upload_name = file_name
+
+    @property
+    def name(self):
+        return self._upload_name
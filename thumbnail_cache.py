@@ -0,0 +1,92 @@
+import os
+import hashlib
+import threading
+import config
+
+# Generated thumbnails keyed by document + mode + skip offset, LRU by mtime
+_sizes = None  # file name -> size (scanned on first use)
+_lock = threading.Lock()
+
+def _cache_key(doc_key, mode, skip_seconds):
+    """File name for one (document, mode, skip) combination"""
+    raw = f"{doc_key}|{mode}|{skip_seconds}"
+    return hashlib.sha256(raw.encode()).hexdigest() + ".jpg"
+
+def _load():
+    """Scan the cache directory on first use"""
+    global _sizes
+    if _sizes is not None:
+        return
+    os.makedirs(config.THUMBNAIL_CACHE_DIR, exist_ok=True)
+    _sizes = {}
+    for name in os.listdir(config.THUMBNAIL_CACHE_DIR):
+        if name.endswith(".jpg"):
+            _sizes[name] = os.path.getsize(os.path.join(config.THUMBNAIL_CACHE_DIR, name))
+
+def _evict():
+    """Drop least recently used thumbnails until the cache fits THUMBNAIL_CACHE_MAX_BYTES"""
+    total = sum(_sizes.values())
+    if total <= config.THUMBNAIL_CACHE_MAX_BYTES:
+        return
+
+    def last_used(name):
+        try:
+            return os.path.getmtime(os.path.join(config.THUMBNAIL_CACHE_DIR, name))
+        except OSError:
+            return 0
+
+    for name in sorted(_sizes, key=last_used):
+        if total <= config.THUMBNAIL_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(os.path.join(config.THUMBNAIL_CACHE_DIR, name))
+        except OSError:
+            pass
+        total -= _sizes.pop(name)
+
+def lookup(doc_key, mode, skip_seconds):
+    """
+    Cached thumbnail for this document/mode/skip
+    Returns: JPEG bytes or None
+    """
+    if not config.THUMBNAIL_CACHE_ENABLED or not doc_key:
+        return None
+    name = _cache_key(doc_key, mode, skip_seconds)
+    try:
+        with _lock:
+            _load()
+            if name not in _sizes:
+                return None
+            path = os.path.join(config.THUMBNAIL_CACHE_DIR, name)
+            os.utime(path)  # Mark as recently used
+            with open(path, 'rb') as f:
+                data = f.read()
+        config.logger.info(f"🗄️ Cached thumbnail ({mode}, skip {skip_seconds}s)")
+        return data
+    except Exception as e:
+        config.logger.warning(f"⚠️ Thumbnail cache lookup failed: {e}")
+        return None
+
+def store(doc_key, mode, skip_seconds, data):
+    """Save a freshly generated thumbnail (JPEG bytes) into the cache"""
+    if not config.THUMBNAIL_CACHE_ENABLED or not doc_key or not data:
+        return
+    name = _cache_key(doc_key, mode, skip_seconds)
+    try:
+        with _lock:
+            _load()
+            path = os.path.join(config.THUMBNAIL_CACHE_DIR, name)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            _sizes[name] = os.path.getsize(path)
+            _evict()
+    except Exception as e:
+        config.logger.warning(f"⚠️ Thumbnail cache store failed: {e}")
+
+def cache_usage():
+    """(thumbnail count, total bytes)"""
+    with _lock:
+        _load()
+        return len(_sizes), sum(_sizes.values())
@@ -1,150 +1,488 @@
+import io
 import os
+import asyncio
 import subprocess
 import tempfile
+from contextlib import asynccontextmanager
+import numpy as np
 from PIL import Image
 import config
 
+# --- FFMPEG WORKER POOL ---
+# Bounded number of concurrent ffmpeg/ffprobe processes (event loop never blocks)
+_ffmpeg_slots = None
+_running_processes = set()
+
+def _get_ffmpeg_slots():
+    """Semaphore created on first use (inside the running loop)"""
+    global _ffmpeg_slots
+    if _ffmpeg_slots is None:
+        _ffmpeg_slots = asyncio.Semaphore(config.FFMPEG_MAX_CONCURRENCY)
+    return _ffmpeg_slots
+
+def _kill(process):
+    """Kill a child process if it is still running"""
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+@asynccontextmanager
+async def media_tool_process(cmd, stdin=asyncio.subprocess.DEVNULL):
+    """
+    Start ffmpeg/ffprobe inside the worker pool and keep it registered for
+    kill_running_processes (shutdown) - for callers that stream through its pipes
+    The process is killed if it is still running when the block exits
+    Usage: async with media_tool_process(cmd, stdin=PIPE) as process: ...
+    """
+    async with _get_ffmpeg_slots():
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=stdin,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _running_processes.add(process)
+        try:
+            yield process
+        finally:
+            _running_processes.discard(process)
+            if process.returncode is None:
+                _kill(process)
+                await process.wait()
+
+async def run_media_tool(cmd, timeout):
+    """
+    Run ffmpeg/ffprobe as an asyncio subprocess inside the worker pool
+    The process is killed on timeout or when the calling task is cancelled (/stop)
+    Returns: (returncode, stdout bytes, stderr bytes)
+    Raises: asyncio.TimeoutError
+    """
+    async with media_tool_process(cmd) as process:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        return process.returncode, stdout, stderr
+
+def kill_running_processes():
+    """Kill every ffmpeg/ffprobe process still running (shutdown)"""
+    for process in list(_running_processes):
+        _kill(process)
+
+def _pipe_output(size=None):
+    """ffmpeg output args: one Telegram-sized JPEG on stdout"""
+    size = size or config.TELEGRAM_THUMB_SIZE
+    return [
+        '-vf', f'scale={size}:{size}:force_original_aspect_ratio=decrease',
+        '-frames:v', '1',
+        '-c:v', 'mjpeg', '-q:v', '2',
+        '-f', 'image2pipe', 'pipe:1'
+    ]
+
 async def generate_video_thumbnail(video_path, time_offset="00:00:01"):
     """
     Generate thumbnail from video at specific time
     time_offset: timestamp in format "HH:MM:SS" or "SS"
-    Returns: path to thumbnail image
+    Returns: JPEG bytes (in memory, Telegram-sized) or None
     """
     try:
-        temp_dir = tempfile.gettempdir()
-        thumb_path = os.path.join(temp_dir, f"thumb_{os.path.basename(video_path)}.jpg")
-        
         # FFmpeg command to extract frame
         cmd = [
-            'ffmpeg', '-y',
+            'ffmpeg', '-hide_banner',
             '-ss', str(time_offset),
-            '-i', video_path,
-            '-vframes', '1',
-            '-q:v', '2',  # High quality
-            thumb_path
-        ]
+            '-i', video_path
+        ] + _pipe_output()
         
-        process = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=30
-        )
+        returncode, stdout, stderr = await run_media_tool(cmd, timeout=30)
         
-        if process.returncode == 0 and os.path.exists(thumb_path):
+        if returncode == 0 and stdout:
             config.logger.info(f"✅ Thumbnail generated at {time_offset}")
-            return thumb_path
+            return stdout
         else:
-            config.logger.error(f"❌ FFmpeg failed: {process.stderr.decode()[:200]}")
+            config.logger.error(f"❌ FFmpeg failed: {stderr.decode(errors='replace')[:200]}")
             return None
             
-    except subprocess.TimeoutExpired:
+    except asyncio.TimeoutError:
         config.logger.error("⏱️ Thumbnail generation timeout")
         return None
     except Exception as e:
         config.logger.error(f"❌ Thumbnail Error: {e}")
         return None
 
+# --- KEYFRAME THUMBNAILS ---
+def score_frames(frames):
+    """
+    Rank candidate frames for use as a thumbnail
+    frames: list of PIL images
+    Score = luma entropy x exposure x relative sharpness (Laplacian variance);
+    black/white fades and blurry motion frames score low
+    Returns: list of float scores (same order)
+    """
+    if not frames:
+        return []
+    
+    entropies, exposures, sharpness = [], [], []
+    for frame in frames:
+        luma = np.asarray(frame.convert('L'), dtype=np.float32)
+        
+        histogram = np.bincount(luma.astype(np.uint8).ravel(), minlength=256)
+        p = histogram[histogram > 0] / float(luma.size)
+        entropies.append(float(-(p * np.log2(p)).sum()) / 8.0)
+        
+        brightness = float(luma.mean()) / 255.0
+        exposures.append(max(0.0, 1.0 - abs(brightness - 0.5) * 2.0) ** 0.5)
+        
+        laplacian = (
+            luma[:-2, 1:-1] + luma[2:, 1:-1] + luma[1:-1, :-2] + luma[1:-1, 2:]
+            - 4.0 * luma[1:-1, 1:-1]
+        )
+        sharpness.append(float(laplacian.var()) if laplacian.size else 0.0)
+    
+    sharpest = max(sharpness) or 1.0
+    return [
+        entropy * exposure * (sharp / sharpest) ** 0.5
+        for entropy, exposure, sharp in zip(entropies, exposures, sharpness)
+    ]
+
+async def extract_keyframes(video_path, skip_seconds, window=None, max_frames=None, size=None):
+    """
+    Decode only keyframes in [skip, skip + window] with ONE ffmpeg process
+    Frames are scaled to fit size x size and returned as JPEG bytes (stdout pipe)
+    """
+    window = window or config.THUMBNAIL_KEYFRAME_WINDOW
+    max_frames = max_frames or config.THUMBNAIL_KEYFRAME_MAX
+    size = size or config.TELEGRAM_THUMB_SIZE
+    
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-skip_frame', 'nokey',
+        '-ss', str(skip_seconds),
+        '-t', str(window),
+        '-i', video_path,
+        '-vf', f'scale={size}:{size}:force_original_aspect_ratio=decrease',
+        '-fps_mode', 'passthrough',
+        '-frames:v', str(max_frames),
+        '-c:v', 'mjpeg', '-q:v', '2',
+        '-f', 'image2pipe', 'pipe:1'
+    ]
+    _, stdout, _ = await run_media_tool(cmd, timeout=60)
+    return _split_jpeg_stream(stdout)
+
+def _best_frame(jpegs):
+    """Index of the best scoring JPEG (CPU work - runs in a thread)"""
+    frames = [Image.open(io.BytesIO(jpeg)) for jpeg in jpegs]
+    scores = score_frames(frames)
+    return max(range(len(scores)), key=scores.__getitem__)
+
+async def generate_keyframe_thumbnail(video_path, skip_seconds=10):
+    """
+    Fast smart thumbnail: score the keyframes of a bounded window in-process
+    and keep the best one, already at Telegram thumbnail size
+    Returns: JPEG bytes or None
+    """
+    try:
+        jpegs = await extract_keyframes(video_path, skip_seconds)
+        if not jpegs:
+            return None
+        
+        loop = asyncio.get_running_loop()
+        best = await loop.run_in_executor(None, _best_frame, jpegs)
+        
+        config.logger.info(f"🎯 Keyframe thumbnail: #{best + 1} of {len(jpegs)} keyframes (skip {skip_seconds}s)")
+        return jpegs[best]
+        
+    except asyncio.TimeoutError:
+        config.logger.error("⏱️ Keyframe thumbnail timeout")
+        return None
+    except Exception as e:
+        config.logger.error(f"❌ Keyframe Thumbnail Error: {e}")
+        return None
+
 async def generate_smart_thumbnail(video_path, skip_seconds=10):
+    """
+    Generate smart thumbnail - keyframe scoring first (SMART_THUMBNAIL_KEYFRAMES),
+    then the FFmpeg thumbnail filter, then a plain frame grab
+    Returns: JPEG bytes or None
+    """
+    if config.SMART_THUMBNAIL_KEYFRAMES:
+        thumb = await generate_keyframe_thumbnail(video_path, skip_seconds)
+        if thumb:
+            return thumb
+    return await generate_filter_thumbnail(video_path, skip_seconds)
+
+async def generate_filter_thumbnail(video_path, skip_seconds=10):
     """
     Generate smart thumbnail using FFmpeg thumbnail filter
     Skips first N seconds and finds best representative frame
     """
+    if not has_ffmpeg_feature('thumbnail'):
+        return await generate_video_thumbnail(video_path, skip_seconds)
+    
     try:
-        temp_dir = tempfile.gettempdir()
-        thumb_path = os.path.join(temp_dir, f"smart_thumb_{os.path.basename(video_path)}.jpg")
-        
         # Smart thumbnail command
         cmd = [
-            'ffmpeg', '-y',
+            'ffmpeg', '-hide_banner',
             '-ss', str(skip_seconds),
             '-i', video_path,
-            '-vf', 'thumbnail,scale=1280:-1',
+            '-vf', f'thumbnail,scale={config.TELEGRAM_THUMB_SIZE}:{config.TELEGRAM_THUMB_SIZE}'
+                   f':force_original_aspect_ratio=decrease',
             '-frames:v', '1',
-            '-q:v', '2',
-            thumb_path
+            '-c:v', 'mjpeg', '-q:v', '2',
+            '-f', 'image2pipe', 'pipe:1'
         ]
         
-        process = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=60
-        )
+        returncode, stdout, _ = await run_media_tool(cmd, timeout=60)
         
-        if process.returncode == 0 and os.path.exists(thumb_path):
+        if returncode == 0 and stdout:
             config.logger.info(f"🎯 Smart thumbnail generated (skip {skip_seconds}s)")
-            return thumb_path
+            return stdout
         else:
             # Fallback to simple extraction
             return await generate_video_thumbnail(video_path, skip_seconds)
             
+    except asyncio.TimeoutError:
+        config.logger.error("⏱️ Smart thumbnail timeout")
+        return await generate_video_thumbnail(video_path, skip_seconds)
     except Exception as e:
         config.logger.error(f"❌ Smart Thumbnail Error: {e}")
         return None
 
-async def extract_multiple_frames(video_path, count=5, interval=None):
+# --- TELEGRAM THUMBNAIL FORMAT ---
+def prepare_thumbnail(data):
+    """
+    Fit image bytes to Telegram's thumbnail limits (JPEG, <= 320px, <= 200KB)
+    Already compliant JPEGs are returned untouched
+    """
+    size = config.TELEGRAM_THUMB_SIZE
+    image = Image.open(io.BytesIO(data))
+    if (image.format == 'JPEG' and max(image.size) <= size
+            and len(data) <= config.TELEGRAM_THUMB_MAX_BYTES):
+        return data
+    
+    image = image.convert('RGB')
+    image.thumbnail((size, size), Image.LANCZOS)
+    
+    encoded = data
+    for quality in (config.TELEGRAM_THUMB_QUALITY, 70, 55, 40):
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=quality, optimize=True)
+        encoded = buffer.getvalue()
+        if len(encoded) <= config.TELEGRAM_THUMB_MAX_BYTES:
+            break
+    return encoded
+
+async def to_telegram_thumbnail(data):
+    """
+    prepare_thumbnail in a worker thread
+    Returns: JPEG bytes ready for send_file(thumb=...) or None
+    """
+    if not data:
+        return None
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, prepare_thumbnail, bytes(data))
+    except Exception as e:
+        config.logger.warning(f"⚠️ Thumbnail not usable: {e}")
+        return None
+
+def _split_jpeg_stream(data):
+    """
+    Split an image2pipe MJPEG stream into individual JPEG files
+    Walks the marker segments; after SOS the first FFD9 is the real EOI
+    (entropy-coded data never contains FF followed by D9)
+    """
+    frames = []
+    position = data.find(b'\xff\xd8')
+    while position != -1:
+        cursor = position + 2
+        end = -1
+        while cursor + 4 <= len(data):
+            if data[cursor] != 0xFF:
+                break
+            marker = data[cursor + 1]
+            if marker == 0xFF:  # Fill byte
+                cursor += 1
+                continue
+            length = int.from_bytes(data[cursor + 2:cursor + 4], 'big')
+            if marker == 0xDA:  # Start of scan
+                end = data.find(b'\xff\xd9', cursor + 2 + length)
+                break
+            cursor += 2 + length
+        if end == -1:
+            break
+        frames.append(data[position:end + 2])
+        position = data.find(b'\xff\xd8', end + 2)
+    return frames
+
+async def get_video_duration(video_path):
+    """Duration in seconds via ffprobe (None if unknown)"""
+    duration_cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        video_path
+    ]
+    try:
+        _, stdout, _ = await run_media_tool(duration_cmd, timeout=10)
+        return float(stdout.decode().strip())
+    except (asyncio.TimeoutError, OSError, ValueError):
+        return None
+
+async def extract_frames_to_memory(video_path, count=5, interval=None, duration=None):
+    """
+    Extract several frames with ONE ffmpeg process - every timestamp is an
+    input-side seek feeding a single filter graph, JPEGs come back on stdout
+    duration: seconds, if already known (e.g. from the Telegram video attribute)
+    Returns: list of (time_pos, jpeg bytes)
+    """
+    if duration is None:
+        duration = await get_video_duration(video_path)
+    if not duration:
+        return []
+    
+    if interval is None:
+        interval = max(1, int(duration / (count + 1)))
+    
+    positions = [(i + 1) * interval for i in range(count) if (i + 1) * interval < duration]
+    if not positions:
+        return []
+    
+    cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error']
+    for time_pos in positions:
+        cmd += ['-ss', str(time_pos), '-i', video_path]
+    
+    # First frame after each seek, concatenated into one stream
+    graph = ";".join(
+        f"[{i}:v:0]trim=end_frame=1,setpts=PTS-STARTPTS[f{i}]" for i in range(len(positions))
+    )
+    inputs = "".join(f"[f{i}]" for i in range(len(positions)))
+    graph += f";{inputs}concat=n={len(positions)}:v=1:a=0,setpts=N[frames]"
+    
+    cmd += [
+        '-filter_complex', graph,
+        '-map', '[frames]',
+        '-fps_mode', 'passthrough',
+        '-c:v', 'mjpeg', '-q:v', '2',
+        '-f', 'image2pipe', 'pipe:1'
+    ]
+    
+    returncode, stdout, stderr = await run_media_tool(cmd, timeout=30 + 5 * len(positions))
+    if returncode != 0:
+        config.logger.error(f"❌ FFmpeg failed: {stderr.decode(errors='replace')[:200]}")
+    
+    frames = _split_jpeg_stream(stdout)
+    if len(frames) != len(positions):
+        # A seek that yields no frame would shift every later timestamp
+        config.logger.warning(f"⚠️ Got {len(frames)} frames for {len(positions)} seek positions - discarded")
+        return []
+    return list(zip(positions, frames))
+
+async def extract_multiple_frames(video_path, count=5, interval=None, duration=None):
     """
     Extract multiple frames from video for selection
     count: number of frames to extract
     interval: time between frames in seconds (auto if None)
+    duration: video length in seconds if known (skips ffprobe)
     Returns: list of thumbnail paths
     """
     try:
-        temp_dir = tempfile.gettempdir()
         frames = []
-        
-        # Get video duration
-        duration_cmd = [
-            'ffprobe', '-v', 'error',
-            '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1',
-            video_path
-        ]
-        
-        result = subprocess.run(duration_cmd, capture_output=True, text=True, timeout=10)
-        duration = float(result.stdout.strip())
-        
-        if interval is None:
-            interval = max(1, int(duration / (count + 1)))
-        
-        for i in range(count):
-            time_pos = (i + 1) * interval
-            if time_pos >= duration:
-                break
-                
-            thumb_path = os.path.join(temp_dir, f"frame_{i}_{os.path.basename(video_path)}.jpg")
-            
-            cmd = [
-                'ffmpeg', '-y',
-                '-ss', str(time_pos),
-                '-i', video_path,
-                '-vframes', '1',
-                '-q:v', '2',
-                thumb_path
-            ]
-            
-            subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30)
-            
-            if os.path.exists(thumb_path):
-                frames.append(thumb_path)
+        for time_pos, jpeg in await extract_frames_to_memory(video_path, count, interval, duration):
+            fd, thumb_path = tempfile.mkstemp(prefix=f"frame_{int(time_pos)}_", suffix=".jpg")
+            with os.fdopen(fd, 'wb') as f:
+                f.write(jpeg)
+            frames.append(thumb_path)
         
         config.logger.info(f"📸 Extracted {len(frames)} frames")
         return frames
         
+    except asyncio.TimeoutError:
+        config.logger.error("⏱️ Frame extraction timeout")
+        return []
     except Exception as e:
         config.logger.error(f"❌ Frame Extraction Error: {e}")
         return []
 
-def is_ffmpeg_available():
-    """Check if FFmpeg is installed"""
+# --- CAPABILITY PROBE ---
+# Probed once at startup - the per-file path only reads the cached result
+_PROBED_FEATURES = {
+    'filters': ('thumbnail', 'select', 'scale', 'tile'),
+    'encoders': ('mjpeg', 'png', 'libwebp'),
+    'protocols': ('http',),
+}
+_capabilities = None
+
+def _tool_output(args, timeout=10):
+    """stdout of a quick ffmpeg/ffprobe query (None if it can't run)"""
     try:
-        subprocess.run(
-            ['ffmpeg', '-version'],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=5
-        )
-        return True
-    except:
-        return False
+        result = subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+def _parse_version(output):
+    """'ffmpeg version 6.0-static ...' -> '6.0-static'"""
+    if not output:
+        return None
+    parts = output.splitlines()[0].split()
+    return parts[2] if len(parts) > 2 else "unknown"
+
+def _parse_listing(output, wanted):
+    """Names from -filters/-encoders/-protocols listings that we care about"""
+    if not output:
+        return set()
+    found = set()
+    for line in output.splitlines():
+        for token in line.split()[:2]:
+            if token in wanted:
+                found.add(token)
+    return found
+
+def probe_ffmpeg_capabilities():
+    """
+    Probe ffmpeg/ffprobe once: availability, versions, needed filters/encoders/protocols
+    Returns: capability dict (also cached for get_ffmpeg_capabilities)
+    """
+    global _capabilities
+    ffmpeg_version = _parse_version(_tool_output(['ffmpeg', '-hide_banner', '-version']))
+    ffprobe_version = _parse_version(_tool_output(['ffprobe', '-hide_banner', '-version']))
+    
+    capabilities = {
+        'ffmpeg': ffmpeg_version is not None,
+        'ffmpeg_version': ffmpeg_version,
+        'ffprobe': ffprobe_version is not None,
+        'ffprobe_version': ffprobe_version,
+        'features': set(),
+    }
+    if ffmpeg_version:
+        for listing, wanted in _PROBED_FEATURES.items():
+            output = _tool_output(['ffmpeg', '-hide_banner', f'-{listing}'])
+            capabilities['features'] |= _parse_listing(output, wanted)
+    
+    _capabilities = capabilities
+    config.logger.info(f"🎬 {ffmpeg_status_text()}")
+    return capabilities
+
+def get_ffmpeg_capabilities():
+    """Cached probe result (probes now if startup didn't)"""
+    if _capabilities is None:
+        return probe_ffmpeg_capabilities()
+    return _capabilities
+
+def has_ffmpeg_feature(name):
+    """True if ffmpeg is installed and supports this filter/encoder/protocol"""
+    capabilities = get_ffmpeg_capabilities()
+    return capabilities['ffmpeg'] and name in capabilities['features']
+
+def ffmpeg_status_text():
+    """One-line summary for /stats and the status page"""
+    capabilities = get_ffmpeg_capabilities()
+    if not capabilities['ffmpeg']:
+        return "FFmpeg: not installed (original thumbnails only)"
+    
+    ffprobe = capabilities['ffprobe_version'] or "missing"
+    features = ", ".join(sorted(capabilities['features'])) or "none"
+    return f"FFmpeg {capabilities['ffmpeg_version']} | ffprobe {ffprobe} | {features}"
+
+def is_ffmpeg_available():
+    """Check if FFmpeg is installed (cached probe - no process spawned)"""
+    return get_ffmpeg_capabilities()['ffmpeg']
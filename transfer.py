@@ -15,8 +15,19 @@ from utils import (
 )
 from stream import SafeBufferedStream  # Changed from ExtremeBufferedStream
 from keyboards import get_progress_keyboard
-from pdf_handler import remove_pdf_pages, find_pages_with_keywords, find_matching_pages_by_image
-from thumbnail_handler import generate_video_thumbnail, generate_smart_thumbnail, is_ffmpeg_available
+from pdf_handler import process_pdf, cached_pages_to_remove
+import pdf_cache
+import thumbnail_cache
+from thumbnail_handler import (
+    generate_video_thumbnail, generate_smart_thumbnail, extract_frames_to_memory,
+    is_ffmpeg_available, has_ffmpeg_feature, to_telegram_thumbnail
+)
+from remote_media import remote_media_url
+from video_remux import needs_remux, remux_to_mp4
+from image_handler import process_image, upload_buffer
+import video_index
+import metrics
+from photo_filter import is_photo_message, match_photo
 
 async def smart_delay(file_size):
     """
@@ -35,6 +46,80 @@ async def smart_delay(file_size):
     config.logger.info(f"⏳ Cooldown: {delay:.1f}s (ban prevention)")
     await asyncio.sleep(delay)
 
+async def build_video_thumbnail(user_client, message, generator, skip_seconds, mode):
+    """
+    Run a thumbnail generator on a video without downloading all of it
+    Reposts hit the thumbnail cache (no download, no ffmpeg); otherwise
+    ffmpeg reads through the loopback range server (only the blocks it needs),
+    falling back to a full download if that fails
+    """
+    doc_key = pdf_cache.document_key(message)
+    thumb = thumbnail_cache.lookup(doc_key, mode, skip_seconds)
+    if thumb:
+        return thumb
+    
+    thumb = await _run_thumbnail_generator(user_client, message, generator, skip_seconds)
+    thumbnail_cache.store(doc_key, mode, skip_seconds, thumb)
+    return thumb
+
+async def download_original_thumb(user_client, message):
+    """Telegram's own preview of the file (bytes or None)"""
+    thumb = await user_client.download_media(message, file=bytes, thumb=-1)
+    metrics.BYTES_DOWNLOADED.inc(len(thumb or b""), source='thumbnail')
+    return thumb
+
+async def _run_thumbnail_generator(user_client, message, generator, skip_seconds):
+    """Generator over a ranged reader first, full download as the fallback"""
+    if config.THUMBNAIL_RANGE_FETCH and has_ffmpeg_feature('http'):
+        try:
+            async with remote_media_url(
+                user_client, message.media.document, message.file.size,
+                message.file.name or f"video_{message.id}"
+            ) as url:
+                thumb = await generator(url, skip_seconds)
+            if thumb:
+                return thumb
+        except Exception as e:
+            config.logger.warning(f"⚠️ Range thumbnail failed, downloading video: {e}")
+    
+    temp_video = await user_client.download_media(message)
+    if temp_video:
+        metrics.BYTES_DOWNLOADED.inc(os.path.getsize(temp_video), source='thumbnail')
+    try:
+        return await generator(temp_video, skip_seconds)
+    finally:
+        if temp_video and os.path.exists(temp_video):
+            os.remove(temp_video)
+
+async def compute_video_signature(user_client, message):
+    """
+    Frame signature for duplicate detection, read through the range server
+    (only the blocks around the sampled frames are downloaded)
+    Returns: (duration, frame hashes) - frames None if no signature could be made
+    """
+    duration = message.file.duration
+    if not duration or not is_ffmpeg_available() or not has_ffmpeg_feature('http'):
+        return duration, None
+    
+    count = config.VIDEO_DEDUP_FRAMES
+    try:
+        async with remote_media_url(
+            user_client, message.media.document, message.file.size,
+            message.file.name or f"video_{message.id}"
+        ) as url:
+            frames = await extract_frames_to_memory(url, count, duration / (count + 1), duration)
+        if len(frames) < count:
+            return duration, None
+        
+        loop = asyncio.get_running_loop()
+        signature = await loop.run_in_executor(
+            None, video_index.frame_signature, [jpeg for _, jpeg in frames]
+        )
+        return duration, signature
+    except Exception as e:
+        config.logger.warning(f"⚠️ Video signature failed: {e}")
+        return duration, None
+
 async def check_rate_limit():
     """
     🔒 Monitor consecutive errors and stop if too many failures
@@ -63,6 +148,7 @@ async def transfer_process(event, user_client, bot_client, source_id, dest_id, s
     total_size = 0
     total_skipped = 0
     overall_start = time.time()
+    job_timings = metrics.JobTimings()
     config.consecutive_errors = 0  # Reset error counter
     
     try:
@@ -98,11 +184,16 @@ async def transfer_process(event, user_client, bot_client, source_id, dest_id, s
             success = False
             stream_file = None
             file_size = 0
+            file_name = None
+            file_result = 'sent'
+            file_timings = metrics.FileTimings(message.id)
             
             while retries > 0 and not success:
+                stream_file = None
                 try:
                     # Refresh message to avoid expired references
-                    fresh_msg = await user_client.get_messages(source_id, ids=message.id)
+                    with file_timings.stage('refresh'):
+                        fresh_msg = await user_client.get_messages(source_id, ids=message.id)
                     if not fresh_msg: 
                         break 
 
@@ -114,6 +205,7 @@ async def transfer_process(event, user_client, bot_client, source_id, dest_id, s
                             success = True
                         else:
                             success = True
+                        file_result = 'text'
                         continue
 
                     # Get file info
@@ -121,6 +213,7 @@ async def transfer_process(event, user_client, bot_client, source_id, dest_id, s
                     
                     if not file_name:
                         success = True
+                        file_result = 'ignored'
                         continue
                     
                     file_size = fresh_msg.file.size
@@ -143,13 +236,43 @@ async def transfer_process(event, user_client, bot_client, source_id, dest_id, s
                     file_name = apply_filename_manipulations(file_name, settings)
                     file_name = sanitize_filename(file_name)
 
-                    await status_message.edit(
-                        f"🔒 **SAFE TRANSFER**\n"
-                        f"📂 `{file_name[:40]}...`\n"
-                        f"💪 Attempt: {config.MAX_RETRIES - retries + 1}/{config.MAX_RETRIES}\n"
-                        f"📊 Progress: {total_processed}/{end_msg - start_msg + 1}",
-                        buttons=get_progress_keyboard()
-                    )
+                    # UNWANTED PHOTOS (reference screenshot / page blocklist)
+                    photo_bytes = None  # Full image, if the filter had to fetch it
+                    if settings.get('photo_filter') and is_photo_message(fresh_msg):
+                        with file_timings.stage('photo_filter'):
+                            reason, photo_bytes = await match_photo(user_client, fresh_msg, settings)
+                        if reason:
+                            config.logger.info(f"📸 Photo skipped: {file_name[:40]} ({reason})")
+                            file_result = 'filtered'
+                            total_skipped += 1
+                            success = True
+                            continue
+                    
+                    # DUPLICATE VIDEOS (already delivered to this destination)
+                    video_entry = None
+                    if settings.get('video_dedup') and is_video_mode:
+                        doc_key = pdf_cache.document_key(fresh_msg)
+                        duplicate = video_index.find_duplicate(dest_id, doc_key, None)
+                        if not duplicate:
+                            with file_timings.stage('video_signature'):
+                                duration, frames = await compute_video_signature(user_client, fresh_msg)
+                            duplicate = video_index.find_duplicate(dest_id, None, duration, frames)
+                            video_entry = (doc_key, duration, frames)
+                        if duplicate:
+                            config.logger.info(f"🎞️ Duplicate video skipped: {file_name[:40]} = {duplicate[:40]}")
+                            file_result = 'duplicate'
+                            total_skipped += 1
+                            success = True
+                            continue
+                    
+                    with file_timings.stage('status_edit'):
+                        await status_message.edit(
+                            f"🔒 **SAFE TRANSFER**\n"
+                            f"📂 `{file_name[:40]}...`\n"
+                            f"💪 Attempt: {config.MAX_RETRIES - retries + 1}/{config.MAX_RETRIES}\n"
+                            f"📊 Progress: {total_processed}/{end_msg - start_msg + 1}",
+                            buttons=get_progress_keyboard()
+                        )
 
                     start_time = time.time()
                     
@@ -168,93 +291,139 @@ async def transfer_process(event, user_client, bot_client, source_id, dest_id, s
                             elif isinstance(attr, DocumentAttributeAudio):
                                 attributes.append(attr)
 
-                    # Download thumbnail (same as before)
+                    # Thumbnail (kept in memory)
                     thumb = None
+                    thumb_started = time.time()
                     try:
                         thumb_mode = settings.get('thumbnail_mode', 'original')
                         
                         if thumb_mode == 'original':
-                            thumb = await user_client.download_media(fresh_msg, thumb=-1)
+                            thumb = await download_original_thumb(user_client, fresh_msg)
                         elif thumb_mode == 'generate' and is_video_mode:
                             if is_ffmpeg_available():
-                                temp_video = await user_client.download_media(fresh_msg)
                                 skip_seconds = settings.get('thumbnail_skip', 1)
-                                thumb = await generate_video_thumbnail(temp_video, skip_seconds)
-                                if temp_video and os.path.exists(temp_video):
-                                    os.remove(temp_video)
+                                thumb = await build_video_thumbnail(
+                                    user_client, fresh_msg, generate_video_thumbnail, skip_seconds, 'generate'
+                                )
                             else:
-                                thumb = await user_client.download_media(fresh_msg, thumb=-1)
+                                thumb = await download_original_thumb(user_client, fresh_msg)
                         elif thumb_mode == 'smart' and is_video_mode:
                             if is_ffmpeg_available():
-                                temp_video = await user_client.download_media(fresh_msg)
                                 skip_seconds = settings.get('thumbnail_skip', 10)
-                                thumb = await generate_smart_thumbnail(temp_video, skip_seconds)
-                                if temp_video and os.path.exists(temp_video):
-                                    os.remove(temp_video)
+                                thumb = await build_video_thumbnail(
+                                    user_client, fresh_msg, generate_smart_thumbnail, skip_seconds, 'smart'
+                                )
                             else:
-                                thumb = await user_client.download_media(fresh_msg, thumb=-1)
+                                thumb = await download_original_thumb(user_client, fresh_msg)
                         else:
-                            thumb = await user_client.download_media(fresh_msg, thumb=-1)
+                            thumb = await download_original_thumb(user_client, fresh_msg)
                     except Exception as thumb_err:
                         config.logger.error(f"⚠️ Thumbnail error: {thumb_err}")
                         try:
-                            thumb = await user_client.download_media(fresh_msg, thumb=-1)
+                            thumb = await download_original_thumb(user_client, fresh_msg)
                         except:
                             pass
                     
+                    # In-memory JPEG within Telegram's thumbnail limits
+                    thumb = await to_telegram_thumbnail(thumb)
+                    file_timings.add('thumbnail', time.time() - thumb_started)
+                    
                     # Prepare media object
                     media_obj = (fresh_msg.media.document 
                                 if hasattr(fresh_msg.media, 'document') 
                                 else fresh_msg.media.photo)
                     
-                    # PDF PROCESSING (same as before, kept for compatibility)
+                    # PDF PROCESSING (single pass over all selectors)
                     pdf_modified = False
-                    temp_pdf_path = None
+                    pdf_output = None
+                    pdf_output_size = 0
                     
-                    if file_name.lower().endswith('.pdf') and (settings.get('pdf_pages_list') or settings.get('pdf_keywords') or settings.get('pdf_reference_image')):
+                    if file_name.lower().endswith('.pdf') and (settings.get('pdf_pages_list') or settings.get('pdf_keywords') or settings.get('pdf_reference_image') or settings.get('pdf_use_blocklist') or settings.get('pdf_sample_fingerprints')):
+                        temp_pdf_original = None
                         try:
-                            temp_pdf_original = await user_client.download_media(fresh_msg)
-                            pages_to_remove = set()
-                            
-                            if settings.get('pdf_pages_list'):
-                                pages_to_remove.update(settings['pdf_pages_list'])
+                            # 🗄️ Repeat PDF? Resolve pages from the fingerprint cache
+                            doc_key = None
+                            content_hash = None
+                            cached_pages = None
+                            if config.PDF_CACHE_ENABLED:
+                                doc_key = pdf_cache.document_key(fresh_msg)
+                                content_hash = pdf_cache.resolve_content_hash(doc_key)
+                                if content_hash:
+                                    cached_pages = cached_pages_to_remove(content_hash, settings)
                             
-                            if settings.get('pdf_keywords'):
-                                keyword_pages = await find_pages_with_keywords(
-                                    temp_pdf_original, 
-                                    settings['pdf_keywords']
-                                )
-                                pages_to_remove.update(keyword_pages)
-                            
-                            if settings.get('pdf_reference_image'):
-                                ref_image_path = settings['pdf_reference_image']
-                                threshold = settings.get('pdf_image_threshold', 0.7)
-                                image_matched_pages = await find_matching_pages_by_image(
-                                    temp_pdf_original,
-                                    ref_image_path,
-                                    threshold
-                                )
-                                pages_to_remove.update(image_matched_pages)
-                            
-                            if pages_to_remove:
-                                temp_pdf_path, kept, removed = await remove_pdf_pages(
-                                    temp_pdf_original, 
-                                    list(pages_to_remove)
-                                )
-                                if temp_pdf_path:
+                            if cached_pages is not None and not cached_pages:
+                                config.logger.info("🗄️ Cached PDF: nothing to remove, skipping download")
+                            else:
+                                with file_timings.stage('pdf_download'):
+                                    temp_pdf_original = await user_client.download_media(fresh_msg)
+                                metrics.BYTES_DOWNLOADED.inc(os.path.getsize(temp_pdf_original), source='pdf')
+                                
+                                if config.PDF_CACHE_ENABLED and not content_hash:
+                                    content_hash = await asyncio.get_running_loop().run_in_executor(
+                                        None, pdf_cache.file_content_hash, temp_pdf_original
+                                    )
+                                    pdf_cache.link_document(doc_key, content_hash)
+                                
+                                if cached_pages:
+                                    config.logger.info(f"🗄️ Cached PDF: removing pages {sorted(cached_pages)}")
+                                
+                                # One pass: parse once, run all selectors, write from the same parse
+                                with file_timings.stage('pdf_analysis'):
+                                    pdf_output, pdf_output_size, removed_pages, pdf_timings = await process_pdf(
+                                        temp_pdf_original,
+                                        settings,
+                                        content_hash=content_hash,
+                                        pages_to_remove=cached_pages
+                                    )
+                                metrics.observe_stages(pdf_timings, 'pdf')
+                                if pdf_output:
                                     pdf_modified = True
-                                    media_obj = temp_pdf_path
-                            
-                            if temp_pdf_original and os.path.exists(temp_pdf_original):
-                                os.remove(temp_pdf_original)
                         
                         except Exception as pdf_err:
                             config.logger.error(f"❌ PDF Error: {pdf_err}")
+                        
+                        finally:
+                            if temp_pdf_original and os.path.exists(temp_pdf_original):
+                                os.remove(temp_pdf_original)
+                    
+                    # VIDEO REMUX (real MP4 instead of a renamed .mkv/.webm/...)
+                    remux_output = None
+                    remux_size = 0
+                    if (is_video_mode and config.VIDEO_REMUX_ENABLED
+                            and fresh_msg.file.size <= config.VIDEO_REMUX_MAX_SIZE
+                            and needs_remux(fresh_msg) and is_ffmpeg_available()):
+                        with file_timings.stage('remux'):
+                            remux_output, remux_size = await remux_to_mp4(
+                                user_client, media_obj, fresh_msg.file.size,
+                                file_name, start_time, status_message
+                            )
+                    
+                    # IMAGE RECOMPRESSION (real JPEG instead of a renamed PNG/WebP/...)
+                    image_output = None
+                    image_size = 0
+                    if (mime_type == "image/jpeg" and not pdf_modified
+                            and config.IMAGE_RECOMPRESS_ENABLED):
+                        with file_timings.stage('image'):
+                            image_output, image_size = await process_image(
+                                user_client, fresh_msg, file_name, start_time, status_message,
+                                data=photo_bytes
+                            )
                     
                     # CREATE STREAM WITH SAFE SETTINGS
-                    if pdf_modified and temp_pdf_path:
-                        stream_file = temp_pdf_path
-                        file_size = os.path.getsize(temp_pdf_path)
+                    if pdf_modified and pdf_output:
+                        # Rewritten PDF goes straight from its buffer to the upload
+                        stream_file = pdf_output
+                        file_size = pdf_output_size
+                    elif remux_output:
+                        stream_file = remux_output
+                        file_size = remux_size
+                    elif image_output:
+                        stream_file = image_output
+                        file_size = image_size
+                    elif photo_bytes:
+                        # Downloaded by the photo filter - don't fetch it again
+                        stream_file = upload_buffer(photo_bytes, file_name)
+                        file_size = len(photo_bytes)
                     else:
                         stream_file = SafeBufferedStream(  # Changed from Extreme
                             user_client, 
@@ -270,6 +439,7 @@ async def transfer_process(event, user_client, bot_client, source_id, dest_id, s
                     modified_caption = apply_caption_manipulations(fresh_msg.text, settings)
                     
                     # 🔒 UPLOAD WITH SAFE SETTINGS
+                    upload_started = time.time()
                     await bot_client.send_file(
                         dest_id,
                         file=stream_file,
@@ -282,47 +452,64 @@ async def transfer_process(event, user_client, bot_client, source_id, dest_id, s
                         part_size_kb=config.UPLOAD_PART_SIZE  # Now 512KB
                     )
                     
-                    # Cleanup
-                    if thumb and os.path.exists(thumb): 
-                        os.remove(thumb)
-                    if pdf_modified and temp_pdf_path and os.path.exists(temp_pdf_path):
-                        os.remove(temp_pdf_path)
-                    
                     success = True
                     config.consecutive_errors = 0  # Reset on success
                     
+                    if video_entry:
+                        doc_key, duration, frames = video_entry
+                        video_index.add_video(dest_id, doc_key, duration, frames, label=file_name)
+                    
                     elapsed = time.time() - start_time
                     speed = file_size / elapsed / (1024*1024) if elapsed > 0 else 0
                     total_size += file_size
                     
-                    await status_message.edit(
-                        f"✅ **SENT:** `{file_name[:40]}...`\n"
-                        f"⚡ Speed: `{speed:.1f} MB/s`\n"
-                        f"📦 Files: {total_processed + 1}/{end_msg - start_msg + 1}",
-                        buttons=get_progress_keyboard()
-                    )
+                    # Streamed files: time the uploader sat waiting for download chunks
+                    send_seconds = time.time() - upload_started
+                    download_wait = getattr(stream_file, 'wait_seconds', 0.0)
+                    file_timings.add('download_wait', download_wait)
+                    file_timings.add('upload', max(0.0, send_seconds - download_wait))
+                    metrics.BYTES_UPLOADED.inc(file_size)
+                    metrics.FILE_SECONDS.observe(elapsed)
+                    if elapsed > 0:
+                        metrics.FILE_THROUGHPUT.observe(file_size / elapsed)
+                    
+                    with file_timings.stage('status_edit'):
+                        await status_message.edit(
+                            f"✅ **SENT:** `{file_name[:40]}...`\n"
+                            f"⚡ Speed: `{speed:.1f} MB/s`\n"
+                            f"📦 Files: {total_processed + 1}/{end_msg - start_msg + 1}",
+                            buttons=get_progress_keyboard()
+                        )
                     
                     # 🔒 CRITICAL: Delay between files to prevent ban
-                    await smart_delay(file_size)
+                    with file_timings.stage('cooldown'):
+                        await smart_delay(file_size)
 
                 except (errors.FileReferenceExpiredError, errors.MediaEmptyError):
                     config.logger.warning(f"🔄 Ref expired, refreshing...")
+                    metrics.RETRIES.inc(reason='file_reference')
                     retries -= 1
-                    await asyncio.sleep(3)  # Longer delay
+                    with file_timings.stage('retry_wait'):
+                        await asyncio.sleep(3)  # Longer delay
                     continue 
                     
                 except errors.FloodWaitError as e:
                     config.consecutive_errors += 1
                     wait_time = min(e.seconds, 300)  # Max 5 min wait
                     config.logger.warning(f"⏳ FloodWait {wait_time}s")
-                    await status_message.edit(
-                        f"⏳ **Rate Limited by Telegram**\n"
-                        f"Waiting: `{wait_time}s`\n"
-                        f"This is normal - don't worry!\n"
-                        f"Resume after cooldown...",
-                        buttons=get_progress_keyboard()
-                    )
-                    await asyncio.sleep(wait_time)
+                    metrics.FLOOD_WAITS.inc()
+                    metrics.FLOOD_WAIT_SECONDS.inc(wait_time)
+                    metrics.RETRIES.inc(reason='floodwait')
+                    with file_timings.stage('status_edit'):
+                        await status_message.edit(
+                            f"⏳ **Rate Limited by Telegram**\n"
+                            f"Waiting: `{wait_time}s`\n"
+                            f"This is normal - don't worry!\n"
+                            f"Resume after cooldown...",
+                            buttons=get_progress_keyboard()
+                        )
+                    with file_timings.stage('floodwait'):
+                        await asyncio.sleep(wait_time)
                 
                 except MemoryError:
                     config.logger.error("💥 RAM LIMIT! Skipping...")
@@ -340,41 +527,54 @@ async def transfer_process(event, user_client, bot_client, source_id, dest_id, s
                     config.consecutive_errors += 1
                     retries -= 1
                     if retries > 0:
-                        await asyncio.sleep(5)  # Longer delay on error
+                        metrics.RETRIES.inc(reason='error')
+                        with file_timings.stage('retry_wait'):
+                            await asyncio.sleep(5)  # Longer delay on error
                 
                 finally:
-                    # ALWAYS close stream
-                    if stream_file and not pdf_modified:
+                    # ALWAYS close stream (download stream is async, spooled buffers are not)
+                    if isinstance(stream_file, SafeBufferedStream):
                         await stream_file.close()
+                    elif stream_file:
+                        stream_file.close()
 
             if not success:
+                file_result = 'failed'
                 total_skipped += 1
                 config.consecutive_errors += 1
             
+            file_timings.finish(file_result, file_name, file_size)
+            job_timings.add_file(file_timings)
             total_processed += 1
             
             # 🔒 Additional safety: pause every 3 files
             if total_processed % 3 == 0:
                 await asyncio.sleep(2)
+                metrics.observe_stage('cooldown', 2)
+                job_timings.add({'cooldown': 2})
 
         if config.is_running:
             overall_time = time.time() - overall_start
             avg_speed = total_size / overall_time / (1024*1024) if overall_time > 0 else 0
             
+            timing_summary = job_timings.summary_text()
             await status_message.edit(
                 f"🏁 **SAFE TRANSFER COMPLETE!**\n"
                 f"✅ Files: `{total_processed}`\n"
                 f"⏭️ Skipped: `{total_skipped}`\n"
                 f"📦 Size: `{human_readable_size(total_size)}`\n"
                 f"⚡ Avg Speed: `{avg_speed:.1f} MB/s`\n"
-                f"⏱️ Time: `{time_formatter(overall_time)}`\n\n"
-                f"🛡️ No ban risks detected!"
+                f"⏱️ Time: `{time_formatter(overall_time)}`\n"
+                + (f"{timing_summary}\n" if timing_summary else "") +
+                f"\n🛡️ No ban risks detected!"
             )
 
     except Exception as e:
         await status_message.edit(f"💥 **Error:** {str(e)[:100]}")
         config.logger.error(f"Transfer error: {e}")
     finally:
+        if job_timings.files:
+            config.last_job_timings = job_timings
         config.is_running = False
         if session_id in config.active_sessions:
             del config.active_sessions[session_id]
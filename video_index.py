@@ -0,0 +1,162 @@
+import io
+import os
+import time
+import sqlite3
+import threading
+import numpy as np
+import imagehash
+from PIL import Image
+import config
+from page_blocklist import BKTree, hamming
+
+# Videos already delivered, per destination, as a few 64-bit frame PHashes
+# sampled at fixed fractions of the duration (re-encodes keep the same frames
+# at the same relative positions, even with different keyframe placement)
+_connection = None
+_trees = {}  # dest -> (BKTree over frame hashes, {entry_id: entry}, {doc_key: entry})
+_lock = threading.Lock()
+
+def _get_connection():
+    """Open (and create) the video index on first use"""
+    global _connection
+    if _connection is None:
+        db_dir = os.path.dirname(config.VIDEO_DEDUP_INDEX_PATH)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        _connection = sqlite3.connect(config.VIDEO_DEDUP_INDEX_PATH, check_same_thread=False)
+        _connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS videos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                dest TEXT NOT NULL,
+                doc_key TEXT,
+                duration REAL NOT NULL,
+                frames TEXT NOT NULL,
+                label TEXT,
+                created REAL
+            );
+            CREATE INDEX IF NOT EXISTS videos_dest ON videos (dest);
+            """
+        )
+        config.logger.info(f"🎞️ Video index: {config.VIDEO_DEDUP_INDEX_PATH}")
+    return _connection
+
+def _pack_frames(frames):
+    """Frame hashes as text ('-' for frames too flat to identify anything)"""
+    return ",".join("-" if h is None else format(h, '016x') for h in frames)
+
+def _unpack_frames(text):
+    if not text:
+        return []
+    return [None if part == "-" else int(part, 16) for part in text.split(",")]
+
+def _load_dest(dest):
+    """BK-tree of every frame hash delivered to one destination"""
+    dest = str(dest)
+    if dest in _trees:
+        return _trees[dest]
+
+    tree = BKTree()
+    entries = {}
+    documents = {}
+    rows = _get_connection().execute(
+        "SELECT id, doc_key, duration, frames, label FROM videos WHERE dest = ?", (dest,)
+    ).fetchall()
+    for entry_id, doc_key, duration, frames, label in rows:
+        entry = {'doc_key': doc_key, 'duration': duration,
+                 'frames': _unpack_frames(frames), 'label': label}
+        entries[entry_id] = entry
+        if doc_key:
+            documents[doc_key] = entry
+        for frame_hash in entry['frames']:
+            if frame_hash is not None:
+                tree.add(frame_hash, entry_id)
+
+    _trees[dest] = (tree, entries, documents)
+    return _trees[dest]
+
+def frame_signature(jpegs):
+    """
+    64-bit PHash per frame (JPEG bytes)
+    Near-uniform frames (black/white/fades) carry no identity and become None
+    """
+    signature = []
+    for jpeg in jpegs:
+        image = Image.open(io.BytesIO(jpeg))
+        image.draft('L', (256, 256))
+        image = image.convert('L')
+        if float(np.asarray(image).std()) < config.VIDEO_DEDUP_MIN_FRAME_STD:
+            signature.append(None)
+        else:
+            signature.append(int(str(imagehash.phash(image)), 16))
+    return signature
+
+def _durations_match(a, b):
+    tolerance = max(config.VIDEO_DEDUP_DURATION_TOLERANCE, 0.02 * max(a, b))
+    return abs(a - b) <= tolerance
+
+def _frames_match(a, b):
+    """Enough frames at the same positions within the PHash distance"""
+    if len(a) != len(b):
+        return False
+    matched = sum(
+        1 for x, y in zip(a, b)
+        if x is not None and y is not None and hamming(x, y) <= config.VIDEO_DEDUP_FRAME_DISTANCE
+    )
+    return matched >= config.VIDEO_DEDUP_MIN_MATCHES
+
+def find_duplicate(dest, doc_key, duration, frames=None):
+    """
+    Video already delivered to dest? Same Telegram document always matches,
+    re-encodes match on duration + frame signature
+    frames: signature from frame_signature (None = document check only)
+    duration: seconds (only used with frames)
+    Returns: label of the delivered copy or None
+    """
+    with _lock:
+        tree, entries, documents = _load_dest(dest)
+
+        if doc_key in documents:
+            return documents[doc_key]['label'] or doc_key
+
+        if not frames:
+            return None
+
+        candidates = set()
+        for frame_hash in frames:
+            if frame_hash is not None:
+                candidates.update(
+                    entry_id for _, entry_id in tree.query(frame_hash, config.VIDEO_DEDUP_FRAME_DISTANCE)
+                )
+
+        for entry_id in candidates:
+            entry = entries[entry_id]
+            if _durations_match(entry['duration'], duration) and _frames_match(entry['frames'], frames):
+                return entry['label'] or entry['doc_key']
+        return None
+
+def add_video(dest, doc_key, duration, frames, label=None):
+    """Record a delivered video (frames may be empty: document check only)"""
+    frames = list(frames or [])
+    duration = duration or 0
+    with _lock:
+        tree, entries, documents = _load_dest(dest)
+        cursor = _get_connection().execute(
+            "INSERT INTO videos (dest, doc_key, duration, frames, label, created) VALUES (?, ?, ?, ?, ?, ?)",
+            (str(dest), doc_key, duration, _pack_frames(frames), label, time.time())
+        )
+        _get_connection().commit()
+
+        entry = {'doc_key': doc_key, 'duration': duration, 'frames': frames, 'label': label}
+        entries[cursor.lastrowid] = entry
+        if doc_key:
+            documents[doc_key] = entry
+        for frame_hash in frames:
+            if frame_hash is not None:
+                tree.add(frame_hash, cursor.lastrowid)
+
+def index_size():
+    """Number of delivered videos across all destinations"""
+    with _lock:
+        return _get_connection().execute("SELECT COUNT(*) FROM videos").fetchone()[0]
@@ -0,0 +1,131 @@
+import time
+import asyncio
+import config
+import metrics
+from stream import progress_callback, SpooledUploadBuffer
+from thumbnail_handler import media_tool_process
+from utils import human_readable_size
+
+# Containers ffmpeg can demux from a pipe, front to back. MOV/M4V/3GP are
+# left alone: their index (moov) usually sits at the end, so a pipe read
+# only fails after the whole download
+_MP4_MIMES = ('video/mp4',)
+_MP4_EXTENSIONS = ('.mp4',)
+_STREAMABLE_MIMES = (
+    'video/x-matroska', 'video/webm', 'video/x-msvideo', 'video/avi',
+    'video/x-flv', 'video/x-ms-wmv', 'video/x-ms-asf'
+)
+_STREAMABLE_EXTENSIONS = ('.mkv', '.webm', '.avi', '.flv', '.wmv')
+
+def needs_remux(message):
+    """True if the video is in a non-MP4 container ffmpeg can read as a stream"""
+    if not message.file:
+        return False
+    mime_type = (message.file.mime_type or "").lower()
+    name = (message.file.name or "").lower()
+    if mime_type in _MP4_MIMES or name.endswith(_MP4_EXTENSIONS):
+        return False
+    return mime_type in _STREAMABLE_MIMES or name.endswith(_STREAMABLE_EXTENSIONS)
+
+def _remux_command():
+    """ffmpeg: container in on stdin, fragmented MP4 out on stdout, no re-encode"""
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-map', '0:v:0', '-map', '0:a?',
+        '-sn', '-dn',
+        '-c', 'copy',
+        '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+        '-f', 'mp4', 'pipe:1'
+    ]
+
+async def _feed(client, location, file_size, stdin, original, file_name, start_time, status_msg):
+    """
+    Download chunks straight into ffmpeg's stdin, keeping a copy of the
+    original - if ffmpeg gives up, the download still finishes for the fallback
+    """
+    downloaded = 0
+    piping = True
+    try:
+        async for chunk in client.iter_download(
+            location,
+            chunk_size=config.CHUNK_SIZE,
+            request_size=config.CHUNK_SIZE
+        ):
+            original.write(chunk)
+            if piping:
+                try:
+                    stdin.write(chunk)
+                    await stdin.drain()
+                except (BrokenPipeError, ConnectionResetError):
+                    piping = False  # Reported once ffmpeg exits
+            downloaded += len(chunk)
+            metrics.BYTES_DOWNLOADED.inc(len(chunk), source='remux')
+            asyncio.create_task(progress_callback(
+                downloaded, file_size, start_time, file_name, status_msg
+            ))
+    finally:
+        stdin.close()
+    return downloaded
+
+async def _collect(stdout, output):
+    """Fragmented MP4 bytes from ffmpeg into the upload buffer"""
+    while True:
+        data = await stdout.read(1024 * 1024)
+        if not data:
+            return
+        output.write(data)
+
+async def remux_to_mp4(client, location, file_size, file_name, start_time, status_msg):
+    """
+    Download -> ffmpeg -c copy -> fragmented MP4, all overlapped in one pass
+    Telegram needs the final size before the first upload part, so the
+    output is spooled (RAM up to VIDEO_REMUX_MEMORY_LIMIT, anonymous temp file above)
+    Returns: (buffer positioned at 0, size) - the remuxed MP4, or the
+             downloaded original bytes if ffmpeg failed
+    """
+    output = SpooledUploadBuffer(file_name, max_size=config.VIDEO_REMUX_MEMORY_LIMIT)
+    original = SpooledUploadBuffer(file_name, max_size=config.VIDEO_REMUX_MEMORY_LIMIT)
+    started = time.time()
+    try:
+        async with media_tool_process(_remux_command(), stdin=asyncio.subprocess.PIPE) as process:
+            stderr_task = asyncio.create_task(process.stderr.read())
+            feed_task = asyncio.create_task(_feed(
+                client, location, file_size, process.stdin, original,
+                file_name, start_time, status_msg
+            ))
+            collect_task = asyncio.create_task(_collect(process.stdout, output))
+            try:
+                await asyncio.gather(feed_task, collect_task)
+            finally:
+                feed_task.cancel()
+                collect_task.cancel()
+
+            try:
+                returncode = await process.wait()
+                stderr = await stderr_task
+            finally:
+                stderr_task.cancel()
+
+        output_size = output.tell()
+        if returncode != 0 or not output_size:
+            config.logger.warning(
+                f"⚠️ Remux failed, sending the downloaded original: {stderr.decode(errors='replace')[:200]}"
+            )
+            output.close()
+            original_size = original.tell()
+            original.seek(0)
+            return original, original_size
+
+        original.close()
+        output.seek(0)
+        config.logger.info(
+            f"🎞️ Remuxed to MP4: {human_readable_size(file_size)} -> "
+            f"{human_readable_size(output_size)} in {time.time() - started:.1f}s"
+        )
+        return output, output_size
+
+    except BaseException:
+        output.close()
+        original.close()
+        raise